@@ -0,0 +1,398 @@
+# Script to benchmark search engine components on the preprocessed collections
+
+from bigram_language_model import BigramLanguageModel
+from centroid_classifier import CentroidClassifier
+from kNN_reuters import kNN_reuters
+from search_engine import SearchEngine
+from search_service import _worker_handle_request, create_executor
+from sharded_search import ShardedSearch, get_shard_paths
+from spelling_correction import (
+    SpellingCorrector,
+    weighted_edit_distance,
+    weighted_edit_distances,
+)
+
+import argparse
+import ast
+import numpy as np
+import os.path
+import pandas as pd
+import pickle
+import random
+import time
+from typing import List
+from vector_space_model import VectorSpaceModel
+
+
+def make_misspellings(lexicon: List[str], n_words: int, seed: int = 0) -> List[str]:
+    """Creates misspelled words by applying one random insertion, deletion or substitution to random lexicon words.
+    The first letter is kept so that words are compared against the same part of the lexicon
+
+    Arguments:
+        lexicon {List[str]} -- Lexicon to sample words from
+        n_words {int} -- Amount of misspelled words
+
+    Keyword Arguments:
+        seed {int} -- Random seed (default: {0})
+
+    Returns:
+        List[str] -- Misspelled words
+    """
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = rng.sample(sorted(w for w in lexicon if len(w) > 3), n_words)
+
+    misspellings = []
+    for word in words:
+        i = rng.randrange(1, len(word))
+        edit = rng.choice(["insert", "delete", "substitute"])
+        if edit == "insert":
+            word = word[:i] + rng.choice(letters) + word[i:]
+        elif edit == "delete":
+            word = word[:i] + word[i + 1 :]
+        else:
+            word = word[:i] + rng.choice(letters) + word[i + 1 :]
+        misspellings.append(word)
+
+    return misspellings
+
+
+def benchmark_edit_distance(lexicon: List[str], n_words: int = 20) -> None:
+    """Compares per word weighted edit distance against the batched version over the same first letter lexicon
+
+    Arguments:
+        lexicon {List[str]} -- Lexicon of the collection
+
+    Keyword Arguments:
+        n_words {int} -- Amount of misspelled words to correct (default: {20})
+    """
+    spelling_corrector = SpellingCorrector(lexicon)
+    lexicon = sorted(spelling_corrector.lexicon)
+    misspellings = make_misspellings(lexicon, n_words)
+
+    loop_time, batch_time, n_comparisons, max_error = 0, 0, 0, 0
+    for word in misspellings:
+        targets = [w for w in lexicon if w[0] == word[0]]
+        n_comparisons += len(targets)
+
+        start = time.perf_counter()
+        loop_costs = np.array([weighted_edit_distance(word, w) for w in targets])
+        loop_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_costs = weighted_edit_distances(word, targets)
+        batch_time += time.perf_counter() - start
+
+        max_error = max(max_error, np.abs(loop_costs - batch_costs).max())
+
+    print(f"Lexicon size: {len(lexicon)}, misspelled words: {n_words}")
+    print(f"Comparisons: {n_comparisons}, max difference in cost: {max_error:.2e}")
+    print(f"Per word loop: {loop_time / n_words * 1000:.1f} ms per misspelled word")
+    print(f"Batched:       {batch_time / n_words * 1000:.1f} ms per misspelled word")
+    print(f"Speedup:       {loop_time / batch_time:.1f}x")
+    return
+
+
+def benchmark_spelling_candidates(lexicon: List[str], n_words: int = 20) -> None:
+    """Compares check_word with a candidate set against the lower bound filtered lexicon scan, and checks that both give
+    the same top 10 suggestions as computing the weighted edit distance to every word
+
+    Arguments:
+        lexicon {List[str]} -- Lexicon of the collection
+
+    Keyword Arguments:
+        n_words {int} -- Amount of misspelled words to correct (default: {20})
+    """
+    start = time.perf_counter()
+    spelling_corrector = SpellingCorrector(lexicon)
+    build_time = time.perf_counter() - start
+    lexicon = sorted(spelling_corrector.lexicon)
+    misspellings = [w for w in make_misspellings(lexicon, n_words) if w not in spelling_corrector.lexicon]
+
+    # Exhaustive top 10, ties in alphabetical order
+    exhaustive = []
+    for word in misspellings:
+        targets = [w for w in lexicon if w[0] == word[0]]
+        costs = weighted_edit_distances(word, targets)
+        exhaustive.append([(targets[i], costs[i]) for i in np.lexsort((np.arange(len(costs)), costs))[:10]])
+
+    start = time.perf_counter()
+    scanned = [spelling_corrector.check_word(w, use_candidates=False) for w in misspellings]
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidates = [spelling_corrector.check_word(w, use_candidates=True) for w in misspellings]
+    candidates_time = time.perf_counter() - start
+
+    def n_identical(results):
+        return sum(
+            [w for (w, _) in e] == [w for (w, _) in r] and np.allclose([c for (_, c) in e], [c for (_, c) in r])
+            for (e, r) in zip(exhaustive, results)
+        )
+
+    print(f"Corrector built in {build_time:.1f} s, misspelled words: {len(misspellings)}")
+    print(f"Identical top 10 to exhaustive: scan {n_identical(scanned)}, candidates {n_identical(candidates)}")
+    print(f"Lexicon scan:   {scan_time / len(misspellings) * 1000:.2f} ms per misspelled word")
+    print(f"Candidates:     {candidates_time / len(misspellings) * 1000:.2f} ms per misspelled word")
+    return
+
+
+def benchmark_language_model(bigram_language_model: BigramLanguageModel) -> None:
+    """Compares pickled size of the compact bigram language model against the previous representation
+    {w1: {w2: {freq, proba}}} and {term: {freq, proba}} of the same counts, and times lookups
+
+    Arguments:
+        bigram_language_model {BigramLanguageModel} -- Bigram language model
+    """
+    vocabulary = bigram_language_model.get_vocabulary()
+    priors = {
+        term: {"freq": int(freq), "proba": bigram_language_model.get_prior(term)}
+        for (term, freq) in zip(vocabulary, bigram_language_model._unigram_counts)
+    }
+    bigram_model = {}
+    for w1 in vocabulary:
+        words2 = bigram_language_model.get_w2(w1)
+        if len(words2) > 0:
+            bigram_model[w1] = {
+                w2: {
+                    "freq": bigram_language_model.get_bigram_freq(w1, w2),
+                    "proba": bigram_language_model.get_posterior(w1, w2),
+                }
+                for w2 in words2
+            }
+    n_bigrams = sum(len(words2) for words2 in bigram_model.values())
+
+    previous_size = len(pickle.dumps((bigram_model, priors)))
+    compact_size = len(pickle.dumps(bigram_language_model))
+    print(f"Vocabulary: {len(vocabulary)} words, {n_bigrams} bigrams")
+    print(f"Previous representation: {previous_size / 1e6:.2f} MB pickled")
+    print(
+        f"Compact representation:  {compact_size / 1e6:.2f} MB pickled "
+        f"({previous_size / compact_size:.1f}x smaller)"
+    )
+
+    # Lookups of pairs, half of them unseen
+    rng = random.Random(0)
+    pairs = [(w1, rng.choice(vocabulary)) for w1 in rng.choices(vocabulary, k=10000)]
+    start = time.perf_counter()
+    for (w1, w2) in pairs:
+        bigram_language_model.get_posterior(w1, w2)
+    lookup_time = time.perf_counter() - start
+    print(f"Posterior lookup: {lookup_time / len(pairs) * 1e6:.1f} us")
+    return
+
+
+def evaluate_topics(predictions: List[List[str]], labels: List[List[str]]) -> str:
+    """Returns exact match accuracy and precision of the first predicted topic as text
+    """
+    exact = np.mean([set(p) == set(l) for (p, l) in zip(predictions, labels)])
+    first = np.mean([len(p) > 0 and p[0] in l for (p, l) in zip(predictions, labels)])
+    return f"exact match {exact:.3f}, first topic precision {first:.3f}"
+
+
+def benchmark_topic_classifiers(
+    index, documents: pd.DataFrame, topics: List[str], test_size: float = 0.2
+) -> None:
+    """Compares kNN and centroid topic classifiers on held out labelled documents
+
+    Arguments:
+        index {InvertedIndex} -- Index of the whole collection, used by the centroid classifier
+        documents {pd.DataFrame} -- Labelled documents with columns docID, body and topics
+        topics {List[str]} -- All topics
+
+    Keyword Arguments:
+        test_size {float} -- Fraction of documents held out (default: {0.2})
+    """
+    test = documents.sample(frac=test_size, random_state=0)
+    train = documents.drop(test.index)
+    labels = test["topics"].to_list()
+    print(f"Training documents: {len(train)}, held out documents: {len(test)}")
+
+    start = time.perf_counter()
+    knn = kNN_reuters(5)
+    knn.fit(train["body"], train["topics"], train["docID"].reset_index(drop=True))
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = knn.predict_many(test["body"])
+    predict_time = time.perf_counter() - start
+    print(f"kNN:      {evaluate_topics(predictions, labels)}")
+    print(f"          fit {fit_time:.1f} s, {len(test) / predict_time:.0f} documents per second")
+
+    start = time.perf_counter()
+    centroid_classifier = CentroidClassifier(index, topics)
+    centroid_classifier.fit(train["docID"], train["topics"])
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = centroid_classifier.predict_many(test["body"])
+    predict_time = time.perf_counter() - start
+    print(f"Centroid: {evaluate_topics(predictions, labels)}")
+    print(f"          fit {fit_time:.1f} s, {len(test) / predict_time:.0f} documents per second")
+    return
+
+
+def benchmark_serving(
+    engine: SearchEngine, corpus: str, worker_counts: List[int], n_queries: int = 500
+) -> None:
+    """Measures search throughput of pre-fork worker pools sharing one loaded search engine, queries are dispatched to
+    the pool all at once like concurrent requests of the search service
+
+    Arguments:
+        engine {SearchEngine} -- Search engine loaded in this process
+        corpus {str} -- Corpus to search
+        worker_counts {List[int]} -- Amounts of worker processes to compare
+
+    Keyword Arguments:
+        n_queries {int} -- Amount of queries per pool (default: {500})
+    """
+    # Two word queries from the vocabulary of the collection
+    rng = random.Random(0)
+    vocabulary = sorted(w for w in engine.indexes[corpus].dictionary.words_raw if len(w) > 3)
+    params = [
+        {"corpus": corpus, "q": " ".join(rng.sample(vocabulary, 2))} for _ in range(n_queries)
+    ]
+
+    print(f"CPU cores: {os.cpu_count()}, queries: {n_queries}")
+    for n_workers in worker_counts:
+        executor = create_executor(n_workers, engine=engine)
+
+        # Workers are forked and warmed up before timing
+        list(executor.map(_worker_handle_request, ["/search"] * n_workers * 4, params))
+
+        start = time.perf_counter()
+        responses = list(
+            executor.map(_worker_handle_request, ["/search"] * n_queries, params, chunksize=4)
+        )
+        elapsed = time.perf_counter() - start
+        executor.shutdown()
+
+        compute_times = [response["compute_ms"] for (_, response) in responses]
+        print(
+            f"{n_workers} workers: {n_queries / elapsed:.0f} queries per second, "
+            f"median compute {np.median(compute_times):.1f} ms"
+        )
+    return
+
+
+def benchmark_sharded_search(index, shard_paths: List[str], n_queries: int = 200) -> None:
+    """Checks that searching the index shards gives the same ranking and scores as the single index of the collection,
+    on queries with and without stopwords, and compares their latency
+
+    Arguments:
+        index {InvertedIndex} -- Index of the whole collection
+        shard_paths {List[str]} -- Paths of the shards of the same collection, see sharded_search.get_shard_paths
+
+    Keyword Arguments:
+        n_queries {int} -- Amount of generated queries (default: {200})
+    """
+    # Two word queries from the vocabulary of the collection, every other one with stopwords around the words
+    rng = random.Random(0)
+    vocabulary = sorted(w for w in index.dictionary.words_raw if len(w) > 3)
+    queries = []
+    for i in range(n_queries):
+        words = rng.sample(vocabulary, 2)
+        queries.append(f"the {words[0]} of {words[1]}" if i % 2 else " ".join(words))
+
+    vsm_model = VectorSpaceModel(index)
+    sharded_search = ShardedSearch(shard_paths)
+    try:
+        for similarity in ["inner-product", "cosine"]:
+            single_time, sharded_time, n_identical = 0, 0, 0
+            for query in queries:
+                start = time.perf_counter()
+                single = vsm_model.search(query, similarity, include_similarities=True)
+                single_time += time.perf_counter() - start
+                start = time.perf_counter()
+                sharded = sharded_search.search(query, similarity, include_similarities=True)
+                sharded_time += time.perf_counter() - start
+
+                same_docIDs = [docID for (docID, _) in single] == [docID for (docID, _) in sharded]
+                same_scores = np.allclose([s for (_, s) in single], [s for (_, s) in sharded])
+                n_identical += same_docIDs and same_scores
+
+            print(f"{similarity}: identical top 10 on {n_identical} / {len(queries)} queries")
+            print(
+                f"    single index {single_time / len(queries) * 1000:.1f} ms, "
+                f"{len(shard_paths)} shards {sharded_time / len(queries) * 1000:.1f} ms per query"
+            )
+    finally:
+        sharded_search.close()
+    return
+
+
+if __name__ == "__main__":
+
+    # Parse cmd arguments
+    parser = argparse.ArgumentParser(description="Benchmark search engine components")
+    parser.add_argument(
+        "--collection", choices=["reuters", "uo_courses"], default="reuters"
+    )
+    parser.add_argument("--spelling", action="store_true")
+    parser.add_argument("--language_model", action="store_true")
+    parser.add_argument("--topics", action="store_true")
+    parser.add_argument("--serving", action="store_true")
+    parser.add_argument("--sharding", action="store_true")
+    parser.add_argument("--n_words", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    # Paths to preprocessed models
+    file_path = os.path.abspath(os.path.dirname(__file__))
+    index_paths = {
+        "uo_courses": os.path.join(file_path, "../models/indexes/UofO_courses_index.pkl"),
+        "reuters": os.path.join(file_path, "../models/indexes/reuters_index.pkl"),
+    }
+    collection_paths = {
+        "uo_courses": os.path.join(file_path, "../collections/processed/UofO_Courses.csv"),
+        "reuters": os.path.join(file_path, "../collections/processed/reuters.csv"),
+    }
+    bigram_model_paths = {
+        "uo_courses": os.path.join(
+            file_path, "../models/bigram_language_models/UofO_bigram_model.pkl"
+        ),
+        "reuters": os.path.join(
+            file_path, "../models/bigram_language_models/reuters_bigram_model.pkl"
+        ),
+    }
+
+    if args.spelling:
+        index = pickle.load(open(index_paths[args.collection], "rb"))
+        print(f"\nWeighted edit distance on {args.collection} lexicon")
+        benchmark_edit_distance(index.dictionary.words_raw, args.n_words)
+        print(f"\nSpelling correction candidates on {args.collection} lexicon")
+        benchmark_spelling_candidates(index.dictionary.words_raw, args.n_words)
+
+    if args.language_model:
+        print(f"\nBigram language model size on {args.collection}")
+        bigram_language_model = pickle.load(open(bigram_model_paths[args.collection], "rb"))
+        benchmark_language_model(bigram_language_model)
+
+    if args.topics:
+        print(f"\nTopic classifiers on {args.collection}")
+        index = pickle.load(open(index_paths[args.collection], "rb"))
+        documents = pd.read_csv(collection_paths[args.collection]).dropna(subset=["body"])
+        if args.collection == "reuters":
+            documents["topics"] = documents["topics"].apply(ast.literal_eval)
+            topics = pd.read_table(
+                os.path.join(file_path, "../collections/raw/reuters21578/all-topics-strings.lc.txt"),
+                header=None,
+            )[0].to_list()
+        else:
+            # Courses have no topics, their faculty is used instead
+            documents["topics"] = documents["faculty"].apply(lambda faculty: [faculty])
+            topics = sorted(documents["faculty"].unique())
+        documents = documents.loc[documents["topics"].apply(len) > 0]
+        benchmark_topic_classifiers(index, documents, topics)
+
+    if args.sharding:
+        # Only the Reuters collection is sharded by make_data --shards
+        print("\nSharded search on reuters")
+        index = pickle.load(open(index_paths["reuters"], "rb"))
+        shard_paths = get_shard_paths(
+            os.path.join(file_path, "../models/indexes/reuters_shards"), "reuters"
+        )
+        benchmark_sharded_search(index, shard_paths)
+
+    if args.serving:
+        print(f"\nPre-fork search serving on {args.collection}")
+        engine = SearchEngine([args.collection])
+        benchmark_serving(engine, args.collection, args.workers)
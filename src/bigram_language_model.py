@@ -1,70 +1,246 @@
 # Module 1 Final System - Bigram Language Model
 # Purpose: Build a Bigram Language Model
 
-from collections import defaultdict
+import bisect
+import numpy as np
+from collections import Counter, defaultdict
+from multiprocessing import Pool
 from nltk import bigrams
 from sentence_preprocessing import stopword_removal, tokenize
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 
-# TODO: maybe don't use default dict as each access will add a new entry
+def count_ngrams(corpus: List[str]) -> Tuple[Counter, Counter]:
+    """Counts terms and bigrams of a corpus, after lower case, removing special characters and stopword removal.
+    Bigrams don't cross documents so counts of shards of a corpus can simply be added up
+
+    Arguments:
+        corpus {List[str]} -- List of documents
+
+    Returns:
+        Tuple[Counter, Counter] -- Frequency of each term, frequency of each bigram (w1, w2)
+    """
+    unigram_counts = Counter()
+    bigram_counts = Counter()
+    for doc in corpus:
+        doc_tokens = stopword_removal(tokenize(doc))
+        unigram_counts.update(doc_tokens)
+        bigram_counts.update(bigrams(doc_tokens))
+
+    return unigram_counts, bigram_counts
 
 
 class BigramLanguageModel:
     """Bigram language model built on given corpus. Preprocessing done is lower case, remove special characters and stopword removal
     
+    The model only stores counts in compact arrays and is read only once built, probabilities are computed on demand:
+        _vocabulary: words sorted alphabetically, the id of a word is its position
+        _unigram_counts: count of each word id
+        _indptr, _w2_ids, _counts: CSR arrays, words following w1 are _w2_ids[_indptr[w1]:_indptr[w1 + 1]] sorted by id
+        _top_indptr, _top_positions: CSR arrays of the positions (in _w2_ids and _counts) of the top k most likely words
+            following each w1, by decreasing probability
+
+    Counts of models can be added up with merge, and counts of new documents with add_documents.
+
     Attributes:
         None
     """
 
-    def __init__(self, corpus: List[str]):
-        # Bigram model represented as {'w1': {'list of w2': {'freq', 'proba}}}
-        self._bigram_model = defaultdict(self._create_dd_w2)
-        # Priors represented as {'term': {'freq': 'proba'}}
-        self._priors = {}
+    def __init__(
+        self,
+        corpus: List[str],
+        top_k: int = 10,
+        n_processes: int = 1,
+        shard_size: int = 1000,
+    ):
+        self._top_k = top_k
 
-        # Get tokens and bigrams for each document within corpus
-        corpus_tokens = [tokenize(doc) for doc in corpus]
-        corpus_tokens = [stopword_removal(doc_tokens) for doc_tokens in corpus_tokens]
-        corpus_bigrams = [bigrams(doc_tokens) for doc_tokens in corpus_tokens]
+        # Count terms and bigrams, by shards of documents in a process pool
+        if n_processes > 1 and len(corpus) > shard_size:
+            shards = [
+                corpus[i : i + shard_size] for i in range(0, len(corpus), shard_size)
+            ]
+            with Pool(n_processes) as pool:
+                shard_counts = pool.map(count_ngrams, shards)
 
-        # Calculate bigram freq and probabilities
-        for doc_bigrams in corpus_bigrams:
-            self._calculate_bigram_freq(doc_bigrams)
-        self._calculate_bigram_proba()
+            unigram_counts, bigram_counts = Counter(), Counter()
+            for (shard_unigram_counts, shard_bigram_counts) in shard_counts:
+                unigram_counts.update(shard_unigram_counts)
+                bigram_counts.update(shard_bigram_counts)
+        else:
+            unigram_counts, bigram_counts = count_ngrams(corpus)
 
-        # Calculate priors
-        for doc_tokens in corpus_tokens:
-            self._calculate_term_freq(doc_tokens)
-        self._calculate_term_priors()
+        self._build(unigram_counts, bigram_counts)
 
         return
 
-    def _calculate_term_freq(self, doc_tokens: List[str]) -> None:
-        """Calculates frequencies of each term
+    def _build(self, unigram_counts: Dict[str, int], bigram_counts: Dict[Tuple[str, str], int]) -> None:
+        """Builds the compact arrays of the model from counts
+
+        Arguments:
+            unigram_counts {Dict[str, int]} -- Frequency of each term
+            bigram_counts {Dict[Tuple[str, str], int]} -- Frequency of each bigram (w1, w2)
+        """
+        # Intern words, ids follow alphabetical order so words sharing a prefix have contiguous ids
+        vocabulary = sorted(unigram_counts.keys())
+        word_ids = {word: i for (i, word) in enumerate(vocabulary)}
+        vocabulary_counts = np.array([unigram_counts[word] for word in vocabulary], dtype=np.int64)
+
+        n_bigrams = len(bigram_counts)
+        w1_ids = np.empty(n_bigrams, dtype=np.int32)
+        w2_ids = np.empty(n_bigrams, dtype=np.int32)
+        counts = np.empty(n_bigrams, dtype=np.int32)
+        for (i, ((w1, w2), count)) in enumerate(bigram_counts.items()):
+            w1_ids[i] = word_ids[w1]
+            w2_ids[i] = word_ids[w2]
+            counts[i] = count
+
+        self._build_arrays(vocabulary, vocabulary_counts, w1_ids, w2_ids, counts)
+
+        return
+
+    def _build_arrays(
+        self,
+        vocabulary: List[str],
+        unigram_counts: np.ndarray,
+        w1_ids: np.ndarray,
+        w2_ids: np.ndarray,
+        counts: np.ndarray,
+    ) -> None:
+        """Builds the compact arrays of the model from counts of interned words
+
+        Arguments:
+            vocabulary {List[str]} -- Words sorted alphabetically
+            unigram_counts {np.ndarray} -- Frequency of each word id
+            w1_ids {np.ndarray} -- Id of the first word of each bigram, in any order
+            w2_ids {np.ndarray} -- Id of the second word of each bigram
+            counts {np.ndarray} -- Frequency of each bigram
+        """
+        self._vocabulary = vocabulary
+        self._word_ids = {word: i for (i, word) in enumerate(self._vocabulary)}
+        n_words = len(self._vocabulary)
+
+        self._unigram_counts = unigram_counts.astype(np.int64)
+        self._total_count = int(self._unigram_counts.sum())
+
+        # Bigram counts as CSR arrays sorted by (w1, w2)
+        order = np.lexsort((w2_ids, w1_ids))
+        w1_ids = w1_ids[order]
+        self._w2_ids = w2_ids[order].astype(np.int32)
+        self._counts = counts[order].astype(np.int32)
+        self._indptr = np.zeros(n_words + 1, dtype=np.int64)
+        np.cumsum(np.bincount(w1_ids, minlength=n_words), out=self._indptr[1:])
+        self._row_totals = np.bincount(w1_ids, weights=self._counts, minlength=n_words).astype(np.int64)
+
+        # Precompute most likely next words
+        self._calculate_top_w2()
+
+        return
+
+    def _merge_arrays(self, other: "BigramLanguageModel") -> Tuple:
+        """Adds up counts of both models over the union of their vocabularies, without going back to python dictionaries
         
         Arguments:
-            doc_tokens {List[str]} -- List of tokens from document
+            other {BigramLanguageModel} -- Model to add counts from
+
+        Returns:
+            Tuple -- Arguments of _build_arrays for the merged counts
         """
-        for token in doc_tokens:
-            if token not in self._priors.keys():
-                self._priors[token] = {"freq": 1, "proba": 0}
-            else:
-                self._priors[token]["freq"] += 1
+        vocabulary = sorted(set(self._vocabulary) | set(other._vocabulary))
+        n_words = len(vocabulary)
+        vocabulary_array = np.array(vocabulary, dtype=str)
+
+        unigram_counts = np.zeros(n_words, dtype=np.int64)
+        keys, counts = [], []
+        for model in [self, other]:
+            # Ids of the model in the merged vocabulary
+            ids = np.searchsorted(vocabulary_array, np.array(model._vocabulary, dtype=str))
+            unigram_counts[ids] += model._unigram_counts
+
+            w1_ids = np.repeat(ids, np.diff(model._indptr))
+            w2_ids = ids[model._w2_ids]
+            keys.append(w1_ids.astype(np.int64) * n_words + w2_ids)
+            counts.append(model._counts)
+
+        # Add up counts of bigrams found in both models
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(counts), minlength=len(keys))
+
+        return vocabulary, unigram_counts, keys // n_words, keys % n_words, counts
+
+    def merge(self, other: "BigramLanguageModel") -> "BigramLanguageModel":
+        """Creates model with counts of both models, e.g. built on different parts of a corpus
+
+        Arguments:
+            other {BigramLanguageModel} -- Model to add counts from
+
+        Returns:
+            BigramLanguageModel -- New model, same as built on both corpora
+        """
+        model = BigramLanguageModel.__new__(BigramLanguageModel)
+        model._top_k = self._top_k
+        model._build_arrays(*self._merge_arrays(other))
+        return model
+
+    def add_documents(self, corpus: List[str], n_processes: int = 1) -> None:
+        """Adds counts of new documents to the model, only new documents are tokenized and counted
+
+        Arguments:
+            corpus {List[str]} -- List of new documents
+
+        Keyword Arguments:
+            n_processes {int} -- Amount of processes to count new documents with (default: {1})
+        """
+        new_model = BigramLanguageModel(corpus, top_k=self._top_k, n_processes=n_processes)
+        self._build_arrays(*self._merge_arrays(new_model))
+        return
+
+    def _calculate_top_w2(self) -> None:
+        """Calculates the top k most likely next words w2 for each w1, ties are sorted alphabetically
+        """
+        n_words = len(self._vocabulary)
+        row_lengths = np.diff(self._indptr)
+        w1_ids = np.repeat(np.arange(n_words), row_lengths)
+
+        # Sort every row by decreasing count, then keep the first k of each row
+        order = np.lexsort((self._w2_ids, -self._counts, w1_ids))
+        ranks = np.arange(len(order)) - np.repeat(self._indptr[:-1], row_lengths)
+        order = order[ranks < self._top_k]
+
+        self._top_positions = order
+        self._top_indptr = np.zeros(n_words + 1, dtype=np.int64)
+        np.cumsum(np.minimum(row_lengths, self._top_k), out=self._top_indptr[1:])
         return
 
-    def _calculate_term_priors(self) -> None:
-        """Calculates prior probability for each individual word
+    def __getstate__(self) -> Dict:
+        """Word ids are not pickled as they are rebuilt from the vocabulary
         """
-        total = 0
-        for term, val in self._priors.items():
-            total += val["freq"]
-        for term in self._priors.keys():
-            self._priors[term]["proba"] = self._priors[term]["freq"] / total
+        state = self.__dict__.copy()
+        del state["_word_ids"]
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        """Restores pickled model, models pickled with the previous dictionary representation are converted to arrays
+        """
+        if "_bigram_model" in state:
+            self._top_k = state.get("_top_k", 10)
+            unigram_counts = {term: val["freq"] for term, val in state["_priors"].items()}
+            bigram_counts = {
+                (w1, w2): val["freq"]
+                for w1, words2 in state["_bigram_model"].items()
+                for w2, val in words2.items()
+                if val["freq"] > 0
+            }
+            self._build(unigram_counts, bigram_counts)
+            return
+
+        self.__dict__.update(state)
+        self._word_ids = {word: i for (i, word) in enumerate(self._vocabulary)}
         return
 
     def _create_dd_w2(self) -> Dict:
-        """Helper function to create default dict that can be pickled
+        """Helper function to create default dict that can be pickled.
+        Kept so that models pickled with the previous dictionary representation can still be loaded
         
         Returns:
             Dict -- Default dictionary with default values
@@ -72,34 +248,105 @@ class BigramLanguageModel:
         return defaultdict(self._create_dd_val)
 
     def _create_dd_val(self) -> Dict:
-        """Helper function to create default dict that can be pickled
+        """Helper function to create default dict that can be pickled.
+        Kept so that models pickled with the previous dictionary representation can still be loaded
         
         Returns:
             Dict -- Default values
         """
         return {"freq": 0, "proba": 0}
 
-    def _calculate_bigram_freq(self, doc_bigrams) -> None:
-        """Calculates frequency for each bigram and stores in self._bigram_model
+    def _row(self, w1: str) -> Tuple[int, int]:
+        """Returns start and end of the CSR row of w1, an empty row if w1 is unknown
         
         Arguments:
-            doc {str} -- Single document from corpus
+            w1 {str} -- First word in bigram
+        
+        Returns:
+            Tuple[int, int] -- (start, end) positions in self._w2_ids and self._counts
         """
-        for (w1, w2) in doc_bigrams:
-            self._bigram_model[w1][w2]["freq"] += 1
-        return
+        w1_id = self._word_ids.get(w1)
+        if w1_id is None:
+            return 0, 0
+        return self._indptr[w1_id], self._indptr[w1_id + 1]
 
-    def _calculate_bigram_proba(self) -> None:
-        """Calculates probability of each bigram P(w2|w1) and stores in self._bigram_model
+    def get_top_w2(self, w1: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Returns the k most likely words w2 following w1 from the precomputed table
+        
+        Arguments:
+            w1 {str} -- First word in bigram
+        
+        Keyword Arguments:
+            k {int} -- Amount of words to return (default: {10})
+        
+        Returns:
+            List[Tuple[str, float]] -- List of (w2, P(w2|w1)) sorted by decreasing probability
         """
-        for w1 in self._bigram_model.keys():
-            words2 = self._bigram_model[w1]
-            total_freq = 0
-            for w2, val in words2.items():
-                total_freq += val["freq"]
-            for w2, val in words2.items():
-                val["proba"] = val["freq"] / total_freq
-        return
+        w1_id = self._word_ids.get(w1)
+        if w1_id is None:
+            return []
+
+        # More words than stored are asked for
+        if k > self._top_k:
+            start, end = self._row(w1)
+            positions = start + np.argsort(-self._counts[start:end], kind="stable")[:k]
+        else:
+            positions = self._top_positions[self._top_indptr[w1_id] : self._top_indptr[w1_id + 1]][:k]
+
+        total = self._row_totals[w1_id]
+        return [
+            (self._vocabulary[self._w2_ids[position]], float(self._counts[position] / total))
+            for position in positions
+        ]
+
+    def get_top_w2_with_prefix(
+        self, w1: str, prefix: str, k: int = 10
+    ) -> List[Tuple[str, float]]:
+        """Returns the k most likely words w2 starting with prefix that follow w1
+        
+        Arguments:
+            w1 {str} -- First word in bigram
+            prefix {str} -- Start of the second word
+        
+        Keyword Arguments:
+            k {int} -- Amount of words to return (default: {10})
+        
+        Returns:
+            List[Tuple[str, float]] -- List of (w2, P(w2|w1)) sorted by decreasing probability
+        """
+        start, end = self._row(w1)
+        if start == end:
+            return []
+
+        # Ids are alphabetical so words with the prefix are a contiguous range of ids and of the sorted row
+        first_id = bisect.bisect_left(self._vocabulary, prefix)
+        last_id = bisect.bisect_left(self._vocabulary, prefix + "\uffff", lo=first_id)
+        row_ids = self._w2_ids[start:end]
+        start, end = start + np.searchsorted(row_ids, [first_id, last_id])
+
+        total = self._row_totals[self._word_ids[w1]]
+        positions = start + np.argsort(-self._counts[start:end], kind="stable")[:k]
+        return [
+            (self._vocabulary[self._w2_ids[position]], float(self._counts[position] / total))
+            for position in positions
+        ]
+
+    def get_vocabulary(self) -> List[str]:
+        """Returns all words seen by the model
+        
+        Returns:
+            List[str] -- Vocabulary
+        """
+        return list(self._vocabulary)
+
+    def _find(self, w1_id: int, w2_id: int) -> int:
+        """Returns position of bigram (w1, w2) in the CSR arrays with a binary search in the row of w1, -1 if not found
+        """
+        start, end = self._indptr[w1_id], self._indptr[w1_id + 1]
+        position = start + np.searchsorted(self._w2_ids[start:end], w2_id)
+        if position < end and self._w2_ids[position] == w2_id:
+            return position
+        return -1
 
     def get_bigram_freq(self, w1: str, w2: str) -> int:
         """ Returns frequency of bigram from corpus
@@ -111,7 +358,12 @@ class BigramLanguageModel:
         Returns:
             int -- Number of counts of (w1, w2)
         """
-        return self._bigram_model[w1][w2]["freq"]
+        w1_id, w2_id = self._word_ids.get(w1), self._word_ids.get(w2)
+        if w1_id is None or w2_id is None:
+            return 0
+
+        position = self._find(w1_id, w2_id)
+        return int(self._counts[position]) if position != -1 else 0
 
     def get_posterior(self, w1: str, w2: str) -> float:
         """Returns posterior probability of P(w2|w1) from corpus
@@ -123,7 +375,10 @@ class BigramLanguageModel:
         Returns:
             float -- Probability value P(w2|w1)
         """
-        return self._bigram_model[w1][w2]["proba"]
+        freq = self.get_bigram_freq(w1, w2)
+        if freq == 0:
+            return 0
+        return float(freq / self._row_totals[self._word_ids[w1]])
 
     def get_prior(self, word: str) -> float:
         """Gets prior probability P(word)
@@ -134,7 +389,10 @@ class BigramLanguageModel:
         Returns:
             float -- Term prior probability
         """
-        return self._priors[word]["proba"] if word in self._priors.keys() else 0
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            return 0
+        return float(self._unigram_counts[word_id] / self._total_count)
 
     def get_w2(self, w1: str) -> str:
         """Returns all words w2 that match (w1,w2) in bigram model
@@ -145,7 +403,8 @@ class BigramLanguageModel:
         Returns:
             str -- Matching second words in bigram
         """
-        return list(self._bigram_model[w1].keys())
+        start, end = self._row(w1)
+        return [self._vocabulary[w2_id] for w2_id in self._w2_ids[start:end]]
 
     def calculate_seq_proba(
         self, sequence: List[str], smoothing: float = 1e-6
@@ -170,3 +429,30 @@ class BigramLanguageModel:
             current_word = next_word
 
         return proba
+
+    def calculate_seq_log_proba(
+        self, sequence: List[str], smoothing: float = 1e-6
+    ) -> float:
+        """Calculates log probability of sequence by summing log posteriors, so that long sequences don't underflow to 0
+
+        Arguments:
+            sequence {List[str]} -- List of words in given order
+
+        Keyword Arguments:
+            smoothing {float} -- Smoothing parameter in case of 0 probabilities (default: {1e-6})
+
+        Returns:
+            float -- Log probability of sequence log10 P(w_n|w_n-1) + .... + log10 P(w_2|w_1) + log10 P(w1),
+                -inf if w1 is unknown
+        """
+        current_word = sequence[0]
+        prior = self.get_prior(current_word)
+        if prior == 0:
+            return -np.inf
+        log_proba = np.log10(prior)
+
+        for next_word in sequence[1:]:
+            log_proba += np.log10(self.get_posterior(current_word, next_word) + smoothing)
+            current_word = next_word
+
+        return float(log_proba)
@@ -1,4 +1,7 @@
 import re
+import bisect
+import heapq
+import itertools
 import pickle
 import dictionary
 import wildcard_management
@@ -6,6 +9,40 @@ import sentence_preprocessing
 from nltk.stem import PorterStemmer
 
 
+def _intersect_sorted(iter1, iter2):
+    # lazy intersection of two sorted docID iterators
+    iter1, iter2 = iter(iter1), iter(iter2)
+    doc1, doc2 = next(iter1, None), next(iter2, None)
+    while doc1 is not None and doc2 is not None:
+        if doc1 == doc2:
+            yield doc1
+            doc1, doc2 = next(iter1, None), next(iter2, None)
+        elif doc1 < doc2:
+            doc1 = next(iter1, None)
+        else:
+            doc2 = next(iter2, None)
+
+
+def _union_sorted(*iters):
+    # lazy union of any number of sorted docID iterators, duplicates are only yielded once
+    previous = None
+    for docID in heapq.merge(*iters):
+        if docID != previous:
+            yield docID
+            previous = docID
+
+
+def _difference_sorted(iter1, iter2):
+    # lazy difference (iter1 - iter2) of two sorted docID iterators
+    iter2 = iter(iter2)
+    doc2 = next(iter2, None)
+    for doc1 in iter1:
+        while doc2 is not None and doc2 < doc1:
+            doc2 = next(iter2, None)
+        if doc1 != doc2:
+            yield doc1
+
+
 class BooleanRetrievalModel:
     """
     Class with methods needed to perform boolean retreival
@@ -91,3 +128,106 @@ class BooleanRetrievalModel:
         # wrapper for recursive descent
         # takes the query string returns a list of doc IDs
         return self.recursive_parse(query, self.inv_ind)
+
+    def iter_results(self, query, start_after=None, candidate_doc_ids=None):
+        # lazy version of retrieve_results, yields the doc IDs in sorted order
+        # start_after is a cursor (last doc ID seen), only doc IDs after it get yielded
+        # candidate_doc_ids (e.g. doc IDs of a topic) is pushed in as an extra AND operand
+        results = self.lazy_parse(query, self.inv_ind, start_after)
+        if candidate_doc_ids is not None:
+            candidates = sorted(candidate_doc_ids)
+            start = 0 if start_after is None else bisect.bisect_right(candidates, start_after)
+            results = _intersect_sorted(results, itertools.islice(candidates, start, None))
+        return results
+
+    def retrieve_page(self, query, page=0, page_size=10, cursor=None, candidate_doc_ids=None):
+        # returns (doc IDs of the page, cursor for the next page)
+        # with a cursor the postings are seeked directly, otherwise the first page * page_size results are skipped
+        # the cursor is None once there are no more results
+        if cursor is not None:
+            results = self.iter_results(query, cursor, candidate_doc_ids)
+        else:
+            results = itertools.islice(
+                self.iter_results(query, candidate_doc_ids=candidate_doc_ids), page * page_size, None
+            )
+
+        docIDs = list(itertools.islice(results, page_size + 1))
+        next_cursor = docIDs[page_size - 1] if len(docIDs) > page_size else None
+        return docIDs[:page_size], next_cursor
+
+    def lazy_parse(self, query_string, index, start_after=None):
+        # same recursive descent as recursive_parse but builds a tree of sorted iterators instead of sets
+        if re.fullmatch("\(.+\)", query_string):
+            return self.lazy_parse(query_string[1:-1], index, start_after)
+        elif re.fullmatch("(.+)\s(AND|OR|AND_NOT)\s(.+)", query_string):
+            parsed_args = self.get_op_parse(query_string)
+            return self.handle_lazy_operation(
+                self.lazy_parse(parsed_args[0], index, start_after),
+                self.lazy_parse(parsed_args[2], index, start_after),
+                parsed_args[1],
+            )
+        else:
+            return self.lazy_single_term(query_string, index, start_after)
+
+    def handle_lazy_operation(self, iter1, iter2, operation):
+        if operation == "AND":
+            return _intersect_sorted(iter1, iter2)
+        elif operation == "OR":
+            return _union_sorted(iter1, iter2)
+        elif operation == "AND_NOT":
+            return _difference_sorted(iter1, iter2)
+
+    def lazy_single_term(self, term, index, start_after=None):
+        # sorted iterator over the postings of a single search term, starting after the cursor
+        term = sentence_preprocessing.stem_tokens(sentence_preprocessing.tokenize(term), PorterStemmer())
+        if term[0].find("*") >= 0:
+            matching_words = wildcard_management.get_indexed_words(term[0], self.inv_ind)
+            return _union_sorted(
+                *[self.lazy_single_term(word, index, start_after) for word in matching_words]
+            )
+
+        postings = index.get_postings(term[0])
+        if not postings:
+            return iter(())
+        start = 0 if start_after is None else bisect.bisect_right(postings, start_after)
+        return itertools.islice(postings, start, None)
+
+    def estimate_cardinality(self, query):
+        # cheap estimate of the number of results for "about N results"
+        # only uses postings lengths and assumes terms occur independently of each other
+        n_docs = len(self.inv_ind.docIDs)
+        return int(round(self.estimate_parse(query, self.inv_ind, n_docs)))
+
+    def estimate_parse(self, query_string, index, n_docs):
+        if re.fullmatch("\(.+\)", query_string):
+            return self.estimate_parse(query_string[1:-1], index, n_docs)
+        elif re.fullmatch("(.+)\s(AND|OR|AND_NOT)\s(.+)", query_string):
+            parsed_args = self.get_op_parse(query_string)
+            size1 = self.estimate_parse(parsed_args[0], index, n_docs)
+            size2 = self.estimate_parse(parsed_args[2], index, n_docs)
+            overlap = size1 * size2 / n_docs if n_docs > 0 else 0
+
+            if parsed_args[1] == "AND":
+                return overlap
+            elif parsed_args[1] == "OR":
+                return size1 + size2 - overlap
+            elif parsed_args[1] == "AND_NOT":
+                return size1 - overlap
+        else:
+            return self.estimate_single_term(query_string, index, n_docs)
+
+    def estimate_single_term(self, term, index, n_docs):
+        term = sentence_preprocessing.stem_tokens(sentence_preprocessing.tokenize(term), PorterStemmer())
+        if term[0].find("*") >= 0:
+            matching_words = wildcard_management.get_indexed_words(term[0], self.inv_ind)
+            # combined the same way as a chain of ORs
+            size = 0
+            for word in matching_words:
+                word_size = self.estimate_single_term(word, index, n_docs)
+                size = size + word_size - size * word_size / n_docs
+            return size
+
+        # postings are stored as a dictionary so the length is known without sorting them
+        if term[0] not in index.index:
+            return 0
+        return len(index.index[term[0]])
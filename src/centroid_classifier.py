@@ -0,0 +1,151 @@
+# Module 6b - Text categorization with topic centroids
+# Purpose: Assign topics to Reuters documents with a Rocchio (nearest centroid) classifier, faster than kNN
+
+import numpy as np
+from collections import Counter
+from inverted_index import InvertedIndex
+from sparse_matrix import TermDocumentMatrix, csr_inner_products, gather_rows
+from typing import List
+
+
+class CentroidClassifier:
+    """Rocchio classifier for topic prediction: the centroid of a topic is the mean of the normalized TF-IDF vectors of
+    its training documents, taken from the index of the collection. A document is assigned the topics whose centroid is
+    the most cosine similar, scoring one document only visits the centroid entries of its terms.
+
+    Centroids are stored sparse as term-major CSR arrays: topics of term id t are
+    _centroid_topics[_centroid_indptr[t]:_centroid_indptr[t + 1]] with weights _centroid_weights
+
+    Attributes:
+        topics {List[str]} -- Topics that can be predicted, e.g. from all-topics-strings.lc.txt
+    """
+
+    def __init__(
+        self, index: InvertedIndex, topics: List[str], relative_threshold: float = 0.9
+    ):
+        """
+        Arguments:
+            index {InvertedIndex} -- Index of the collection, gives document vectors and idf
+            topics {List[str]} -- Topics that can be predicted
+
+        Keyword Arguments:
+            relative_threshold {float} -- Topics scoring at least this fraction of the best topic score are also
+                predicted (default: {0.9})
+        """
+        self.dictionary = index.dictionary
+        self.topics = list(topics)
+        self.topic_ids = {topic: i for (i, topic) in enumerate(self.topics)}
+        self.relative_threshold = relative_threshold
+        self.matrix = TermDocumentMatrix(index)
+
+        n_docs = len(self.matrix.docIDs)
+        self.idfs = np.log10(n_docs / np.maximum(self.matrix.document_freqs, 1))
+        return
+
+    def fit(self, docIDs, Y) -> None:
+        """Builds the centroid of every topic from labelled documents of the index
+
+        Arguments:
+            docIDs {[type]} -- Document IDs of the training documents, found in the index
+            Y {[type]} -- Topics of each training document
+        """
+        n_terms, n_topics = len(self.matrix.terms), len(self.topics)
+        doc_indptr, doc_term_ids, doc_tf_idfs = self.matrix.to_document_major()
+        lengths = np.sqrt(np.bincount(
+            self.matrix.posting_doc_rows,
+            weights=np.square(self.matrix.tf_idfs),
+            minlength=len(self.matrix.docIDs),
+        ))
+        lengths[lengths == 0] = 1
+
+        # Every (topic, training document) pair with a known topic
+        doc_rows, topic_ids = [], []
+        for (docID, doc_topics) in zip(docIDs, Y):
+            for topic in doc_topics:
+                if topic in self.topic_ids and docID in self.matrix.doc_rows:
+                    doc_rows.append(self.matrix.doc_rows[docID])
+                    topic_ids.append(self.topic_ids[topic])
+        doc_rows = np.array(doc_rows, dtype=np.int64)
+        topic_ids = np.array(topic_ids, dtype=np.int64)
+        topic_counts = np.bincount(topic_ids, minlength=n_topics)
+
+        # Sum normalized document vectors per topic as (topic, term) entries
+        entry_lengths = doc_indptr[doc_rows + 1] - doc_indptr[doc_rows]
+        entry_term_ids = gather_rows(doc_indptr, doc_term_ids, doc_rows)
+        entry_weights = gather_rows(doc_indptr, doc_tf_idfs, doc_rows) / np.repeat(
+            lengths[doc_rows], entry_lengths
+        )
+        entry_topic_ids = np.repeat(topic_ids, entry_lengths)
+
+        keys, inverse = np.unique(entry_term_ids * n_topics + entry_topic_ids, return_inverse=True)
+        weights = np.bincount(inverse, weights=entry_weights, minlength=len(keys))
+        term_ids, centroid_topics = keys // n_topics, keys % n_topics
+
+        # Mean of the topic documents, then normalized so that scores are cosine similarities
+        weights /= topic_counts[centroid_topics]
+        norms = np.sqrt(np.bincount(centroid_topics, weights=np.square(weights), minlength=n_topics))
+        weights /= norms[centroid_topics]
+
+        # Keys are sorted by term so entries are already term-major
+        self._centroid_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=n_terms), out=self._centroid_indptr[1:])
+        self._centroid_topics = centroid_topics
+        self._centroid_weights = weights
+        return
+
+    def predict(self, X) -> List[str]:
+        """Predict topics of given document body
+
+        Arguments:
+            X {[type]} -- Document Body to predict topic
+
+        Returns:
+            List[str] -- Predicted list of topics
+        """
+        return self.predict_many([X])[0]
+
+    def predict_many(self, X, chunk_size: int = 1024) -> List[List[str]]:
+        """Predict topics of many document bodies, by chunks of documents scored against all centroids at once
+
+        Arguments:
+            X {[type]} -- Document bodies to predict topics
+
+        Keyword Arguments:
+            chunk_size {int} -- Amount of documents scored at once (default: {1024})
+
+        Returns:
+            List[List[str]] -- Predicted list of topics for each document, empty if no term of a document is known
+        """
+        # TF-IDF vectors of the documents with the idf of the index
+        query_vectors = []
+        for doc in X:
+            frequencies = Counter(self.dictionary.preprocess_document(doc))
+            query_vectors.append(
+                {
+                    term: np.log10(1 + freq) * self.idfs[self.matrix.term_ids[term]]
+                    for (term, freq) in frequencies.items()
+                    if term in self.matrix.term_ids
+                }
+            )
+
+        predictions = []
+        for start in range(0, len(query_vectors), chunk_size):
+            scores = csr_inner_products(
+                self._centroid_indptr,
+                self._centroid_topics,
+                self._centroid_weights,
+                len(self.topics),
+                *self.matrix.to_query_matrix(query_vectors[start : start + chunk_size]),
+            )
+
+            # Best topic and the topics close to it
+            best_scores = scores.max(axis=1, initial=0)
+            for (row, best_score) in zip(scores, best_scores):
+                if best_score <= 0:
+                    predictions.append([])
+                    continue
+                topic_ids = np.flatnonzero(row >= self.relative_threshold * best_score)
+                topic_ids = topic_ids[np.argsort(-row[topic_ids], kind="stable")]
+                predictions.append([self.topics[i] for i in topic_ids])
+
+        return predictions
@@ -2,46 +2,33 @@
 # Purpose: Access documents from the corpus
 
 
+from document_store import DocumentStore
+from topic_index import TopicIndex
 import os.path
 import pandas as pd
 from typing import List
 
 
-def _convert_topic_to_array(topics_list: pd.Series) -> List[List[str]]:
-    """Parse string column and returns a column of type list
-    
-    Arguments:
-        topics_list {pd.Series} -- Topic column with string representation of array
-    
-    Returns:
-        List[List[str]] -- List of topics per corpus
-    """
-    topics_list = []
-    for topics in reuters_corpus.topics:
-        topics = topics[1:-1].replace("'", "").replace(",", "").split(" ")
-        topics = [] if topics == [""] else topics
-        topics_list.append(topics)
-    return topics_list
-
-def get_corpus_texts(corpus: str, docIDs: list, topic: str = None) -> pd.DataFrame:
-    """Returns documents containing matching docIDs for given corpus in same order as input docIDs list filtered by topic
+def get_topic_docIDs(corpus: str, topic: str, topic_index: TopicIndex = None) -> set:
+    """Returns docIDs of all documents of given corpus with given topic, to be used as a candidate filter during retrieval
     
     Arguments:
         corpus {str} -- corpus from which to get documents from, options are either 'uo_courses' or 'reuters'
-        docIDs {list} -- document docIDs to return
         topic {str} -- Topic to filter results
+        topic_index {TopicIndex} -- Topic index of the corpus, the document store is scanned if None
     
     Returns:
-        pd.DataFrame -- Dataframe containing documents with given docIDs and topic
+        set -- docIDs with given topic, None if there is no topic filter for the corpus
     """
-    results = corpora[corpus].loc[docIDs]
+    if not topic or corpus != "reuters":
+        return None
 
-    # Get subset of texts of given topic
-    if topic and corpus == "reuters":
-        topic_filter = contains_topic(results["topics"], topic)
-        results = results.loc[topic_filter]
+    if topic_index is not None:
+        return set(topic_index.get_docIDs(topic))
 
-    return results
+    store = document_stores[corpus]
+    topic_filter = contains_topic(store.get_column("topics"), topic)
+    return {docID for (docID, contains) in zip(store.get_docIDs(), topic_filter) if contains}
 
 
 def contains_topic(topics_list: List[str], topic: str) -> List[bool]:
@@ -58,21 +45,17 @@ def contains_topic(topics_list: List[str], topic: str) -> List[bool]:
     return contains
 
 
-# Load preprocessed corpus dataframes
+# Document stores of the preprocessed corpora, opened on first access
 file_path = os.path.abspath(os.path.dirname(__file__))
 
-uo_courses_corpus = pd.read_csv(
-    os.path.join(file_path, "../collections/processed/UofO_Courses.csv"),
-    index_col="docID",
-)
-
-reuters_corpus = pd.read_csv(
-    os.path.join(file_path, "../collections/processed/reuters_with_topics.csv"),
-    index_col="docID",
-)
-reuters_corpus["topics"] = _convert_topic_to_array(reuters_corpus["topics"])
-
-corpora = {"uo_courses": uo_courses_corpus, "reuters": reuters_corpus}
+document_stores = {
+    "uo_courses": DocumentStore(
+        os.path.join(file_path, "../collections/processed/UofO_Courses_store")
+    ),
+    "reuters": DocumentStore(
+        os.path.join(file_path, "../collections/processed/reuters_store")
+    ),
+}
 
 # Topics for reuters collection
 reuters_topics = pd.read_table(
@@ -0,0 +1,96 @@
+# Module 8b - Document similarity graph
+# Purpose: Precompute the most similar documents of every document for "more like this" and kNN lookups
+
+import numpy as np
+from inverted_index import InvertedIndex
+from sparse_matrix import TermDocumentMatrix, top_k_rows
+from typing import List, Tuple
+
+
+class DocumentSimilarityGraph:
+    """Top k most similar documents of every document of an index by cosine similarity of their TF-IDF vectors,
+    computed by chunks of documents against the whole term-document matrix.
+
+    Neighbours are stored as CSR arrays: neighbours of document row i are _neighbour_rows[_indptr[i]:_indptr[i + 1]]
+    sorted by decreasing similarity, rows follow the docIDs of the index.
+
+    Attributes:
+        docIDs {List} -- DocIDs of the index
+    """
+
+    def __init__(
+        self,
+        index: InvertedIndex,
+        k: int = 10,
+        threshold: float = 0.1,
+        chunk_size: int = 256,
+    ):
+        """
+        Arguments:
+            index {InvertedIndex} -- Index of the collection
+
+        Keyword Arguments:
+            k {int} -- Amount of neighbours stored per document (default: {10})
+            threshold {float} -- Minimum cosine similarity of neighbours (default: {0.1})
+            chunk_size {int} -- Amount of documents scored at once (default: {256})
+        """
+        matrix = TermDocumentMatrix(index)
+        self.docIDs = matrix.docIDs
+        self._doc_rows = matrix.doc_rows
+        n_docs = len(self.docIDs)
+
+        # Document -> terms CSR arrays, i.e. the transposed matrix
+        doc_indptr, doc_term_ids, doc_tf_idfs = matrix.to_document_major()
+
+        lengths = np.sqrt(np.bincount(matrix.posting_doc_rows, weights=np.square(matrix.tf_idfs), minlength=n_docs))
+        lengths[lengths == 0] = 1
+
+        self._indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        neighbour_rows, similarities = [], []
+        for start in range(0, n_docs, chunk_size):
+            end = min(start + chunk_size, n_docs)
+
+            # Documents of the chunk are the queries, normalized so that inner products are cosine similarities
+            query_indptr = doc_indptr[start : end + 1] - doc_indptr[start]
+            query_slice = slice(doc_indptr[start], doc_indptr[end])
+            query_weights = doc_tf_idfs[query_slice] / np.repeat(lengths[start:end], np.diff(query_indptr))
+            scores = matrix.inner_products(query_indptr, doc_term_ids[query_slice], query_weights)
+            scores /= lengths
+
+            # Documents are not their own neighbour, similarities below the threshold are dropped
+            scores[np.arange(end - start), np.arange(start, end)] = 0
+            scores[scores < threshold] = 0
+
+            for (i, rows) in enumerate(top_k_rows(scores, k)):
+                neighbour_rows.append(rows)
+                similarities.append(scores[i, rows])
+                self._indptr[start + i + 1] = self._indptr[start + i] + len(rows)
+
+        self._neighbour_rows = np.concatenate(neighbour_rows + [np.empty(0, dtype=np.int64)]).astype(np.int32)
+        self._similarities = np.concatenate(similarities + [np.empty(0)]).astype(np.float32)
+        return
+
+    def get_similar(self, docID, k: int = None) -> List[Tuple[str, float]]:
+        """Returns the documents most similar to a document ("more like this")
+
+        Arguments:
+            docID {[type]} -- Document id
+
+        Keyword Arguments:
+            k {int} -- Amount of documents to return, at most the k of the graph (default: {None})
+
+        Returns:
+            List[Tuple[str, float]] -- List of (docID, cosine similarity) sorted by decreasing similarity, empty if docID
+                is not found
+        """
+        row = self._doc_rows.get(docID)
+        if row is None:
+            return []
+
+        start, end = self._indptr[row], self._indptr[row + 1]
+        return [
+            (self.docIDs[neighbour_row], float(similarity))
+            for (neighbour_row, similarity) in zip(
+                self._neighbour_rows[start:end][:k], self._similarities[start:end][:k]
+            )
+        ]
@@ -0,0 +1,216 @@
+# Module 5b - Document Store
+# Purpose: Fetch the fields of a few documents of a corpus without loading the whole corpus in memory
+
+import json
+import numpy as np
+import os.path
+import pandas as pd
+from pathlib import Path
+from typing import List
+
+
+class DocumentStore:
+    """Columnar store of the documents of a corpus written by make_data. Each text column is a blob of the utf-8
+    encoded values of all documents, value of document row i is blob[offsets[i]:offsets[i + 1]]. Blobs and offsets are
+    memory mapped when the store is first accessed, so fetching documents only reads their own fields.
+
+    Integer docIDs (reuters) are looked up in a dense docID -> row table, other docIDs (uo_courses) in a dictionary.
+    List columns (e.g. topics) are stored as space separated values.
+
+    Attributes:
+        folder {str} -- Folder of the store
+    """
+
+    def __init__(self, folder: str):
+        """
+        Arguments:
+            folder {str} -- Folder of the store, written by DocumentStore.write
+        """
+        self.folder = folder
+        self._is_open = False
+        return
+
+    @staticmethod
+    def write(documents: pd.DataFrame, folder: str, list_columns: List[str] = []) -> None:
+        """Writes the documents of a corpus as a document store
+
+        Arguments:
+            documents {pd.DataFrame} -- Documents of the corpus with a docID column
+            folder {str} -- Folder of the store, created if needed
+
+        Keyword Arguments:
+            list_columns {List[str]} -- Columns whose values are lists of strings (default: {[]})
+        """
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        columns = [column for column in documents.columns if column != "docID"]
+
+        for column in columns:
+            if column in list_columns:
+                values = [" ".join(value) for value in documents[column]]
+            else:
+                values = ["" if pd.isna(value) else str(value) for value in documents[column]]
+            encoded = [value.encode("utf-8") for value in values]
+
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            with open(os.path.join(folder, f"{column}.bin"), "wb") as blob_file:
+                blob_file.write(b"".join(encoded))
+            np.save(os.path.join(folder, f"{column}_offsets.npy"), offsets)
+
+        # Dense docID -> row table for integer docIDs, -1 for unused docIDs
+        docIDs = documents["docID"].to_numpy()
+        is_integer = np.issubdtype(docIDs.dtype, np.integer)
+        if is_integer:
+            docID_rows = np.full(docIDs.max() + 1 if len(docIDs) > 0 else 0, -1, dtype=np.int64)
+            docID_rows[docIDs] = np.arange(len(docIDs))
+            np.save(os.path.join(folder, "docID_rows.npy"), docID_rows)
+        else:
+            np.save(os.path.join(folder, "docIDs.npy"), docIDs.astype(str))
+
+        with open(os.path.join(folder, "meta.json"), "w") as meta_file:
+            json.dump(
+                {
+                    "columns": columns,
+                    "list_columns": list(list_columns),
+                    "integer_docIDs": bool(is_integer),
+                    "n_documents": len(documents),
+                },
+                meta_file,
+            )
+        return
+
+    def _open(self) -> None:
+        """Memory maps the columns of the store and loads the docID lookup table
+        """
+        with open(os.path.join(self.folder, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        self.columns = meta["columns"]
+        self.list_columns = set(meta["list_columns"])
+        self.n_documents = meta["n_documents"]
+
+        self._blobs, self._offsets = {}, {}
+        for column in self.columns:
+            blob_path = os.path.join(self.folder, f"{column}.bin")
+            # Empty files can't be memory mapped
+            self._blobs[column] = (
+                np.memmap(blob_path, dtype=np.uint8, mode="r")
+                if os.path.getsize(blob_path) > 0
+                else np.empty(0, dtype=np.uint8)
+            )
+            self._offsets[column] = np.load(
+                os.path.join(self.folder, f"{column}_offsets.npy"), mmap_mode="r"
+            )
+
+        if meta["integer_docIDs"]:
+            self._docID_rows = np.load(os.path.join(self.folder, "docID_rows.npy"), mmap_mode="r")
+            self._docID_row_dict = None
+        else:
+            docIDs = np.load(os.path.join(self.folder, "docIDs.npy"))
+            self._docID_row_dict = {docID: i for (i, docID) in enumerate(docIDs.tolist())}
+
+        self._is_open = True
+        return
+
+    def get_row(self, docID) -> int:
+        """Returns the row of a document in the store
+
+        Arguments:
+            docID {[type]} -- Document id
+
+        Returns:
+            int -- Row of the document, None if docID is not found
+        """
+        if not self._is_open:
+            self._open()
+
+        if self._docID_row_dict is not None:
+            return self._docID_row_dict.get(docID)
+
+        if not isinstance(docID, (int, np.integer)) or not 0 <= docID < len(self._docID_rows):
+            return None
+        row = self._docID_rows[docID]
+        return None if row < 0 else int(row)
+
+    def get_value(self, row: int, column: str):
+        """Returns a field of a document
+
+        Arguments:
+            row {int} -- Row of the document, see get_row
+            column {str} -- Column of the field
+
+        Returns:
+            [type] -- Value of the field, a list of strings for list columns
+        """
+        offsets = self._offsets[column]
+        value = bytes(self._blobs[column][offsets[row] : offsets[row + 1]]).decode("utf-8")
+        if column in self.list_columns:
+            return value.split()
+        return value
+
+    def get_documents(self, docIDs: list, columns: List[str] = None) -> pd.DataFrame:
+        """Returns documents with given docIDs in the same order, docIDs not found are skipped
+
+        Arguments:
+            docIDs {list} -- Document ids to return
+
+        Keyword Arguments:
+            columns {List[str]} -- Columns to read, all columns if None (default: {None})
+
+        Returns:
+            pd.DataFrame -- Documents indexed by docID
+        """
+        if not self._is_open:
+            self._open()
+        columns = self.columns if columns is None else columns
+
+        found_docIDs, rows = [], []
+        for docID in docIDs:
+            row = self.get_row(docID)
+            if row is not None:
+                found_docIDs.append(docID)
+                rows.append(row)
+
+        documents = pd.DataFrame(
+            {column: [self.get_value(row, column) for row in rows] for column in columns},
+            index=pd.Index(found_docIDs, name="docID"),
+            columns=columns,
+        )
+        return documents
+
+    def get_column(self, column: str) -> list:
+        """Returns a field of every document, in order of the rows
+
+        Arguments:
+            column {str} -- Column of the field
+
+        Returns:
+            list -- Values of the field
+        """
+        if not self._is_open:
+            self._open()
+        return [self.get_value(row, column) for row in range(self.n_documents)]
+
+    def get_docIDs(self) -> list:
+        """Returns the docIDs of the documents, in order of the rows
+
+        Returns:
+            list -- Document ids
+        """
+        if not self._is_open:
+            self._open()
+        if self._docID_row_dict is not None:
+            return list(self._docID_row_dict.keys())
+
+        docIDs = np.empty(self.n_documents, dtype=np.int64)
+        is_used = np.asarray(self._docID_rows) >= 0
+        docIDs[np.asarray(self._docID_rows)[is_used]] = np.flatnonzero(is_used)
+        return docIDs.tolist()
+
+    def __getstate__(self):
+        # Memory maps are opened again after unpickling, e.g. in another process
+        return {"folder": self.folder}
+
+    def __setstate__(self, state):
+        self.folder = state["folder"]
+        self._is_open = False
+        return
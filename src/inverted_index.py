@@ -111,6 +111,35 @@ class InvertedIndex:
         postings.sort()
         return postings
 
+    def get_term_postings(self, term: str) -> dict:
+        """
+        Return postings stored for given term in form of {docID: {freq, tf-idf}} without sorting them
+        Returns None is term is not in dictionary
+        """
+        if term not in self.index.keys():
+            return None
+
+        return self.index[term]
+
+    def get_docID_postings(self, docID) -> dict:
+        """Returns the sparse vector form of document in form of {term: TF-IDF}, from a forward index docID -> terms
+        built from the inverted index on first use
+        
+        Arguments:
+            docID {[type]} -- document id
+        
+        Returns:
+            dict -- TF-IDF of the terms found in the document, empty if docID is not found
+        """
+        if getattr(self, "_forward_index", None) is None:
+            self._forward_index = defaultdict(dict)
+            for term, postings in self.index.items():
+                for doc_id, weight in postings.items():
+                    self._forward_index[doc_id][term] = weight["tf-idf"]
+            self._forward_index = dict(self._forward_index)
+
+        return self._forward_index.get(docID, {})
+
     def get_docID_vector(self, docID) -> np.array:
         """Returns the vector form of document where each dimension is a term (sorted alphabetically) and contains value TF-IDF
         
@@ -120,8 +149,19 @@ class InvertedIndex:
         Returns:
             np.array -- Vector representation of document using TF-IDF
         """
-        terms = list(self.get_terms())
-        terms.sort()
-        vector = [self.get_tf_idf(term, docID) for term in terms]
-        vector = np.array([val if (val != None) else 0 for val in vector])
+        if getattr(self, "_term_positions", None) is None:
+            terms = sorted(self.get_terms())
+            self._term_positions = {term: i for (i, term) in enumerate(terms)}
+
+        vector = np.zeros(len(self._term_positions))
+        for term, tf_idf in self.get_docID_postings(docID).items():
+            vector[self._term_positions[term]] = tf_idf
         return vector
+
+    def __getstate__(self) -> dict:
+        """Forward index and term positions are not pickled as they are rebuilt on first use
+        """
+        state = self.__dict__.copy()
+        state.pop("_forward_index", None)
+        state.pop("_term_positions", None)
+        return state
@@ -2,19 +2,45 @@
 # Purpose: Assign one or more topics to the Reuters documents that are not assigned any topics
 
 from dictionary import Dictionary
+from document_similarity import DocumentSimilarityGraph
 from inverted_index import InvertedIndex
+from sparse_matrix import TermDocumentMatrix, top_k_rows
 from vector_space_model import VectorSpaceModel
 
 from collections import Counter
+from multiprocessing import Pool
+import numpy as np
 from typing import List
 
 
+# Training matrix of the worker processes of predict_many, set once per process by _init_worker
+_worker_matrix = None
+
+
+def _init_worker(matrix: TermDocumentMatrix) -> None:
+    global _worker_matrix
+    _worker_matrix = matrix
+    return
+
+
+def _nearest_neighbours(matrix: TermDocumentMatrix, query_vectors: List[dict], k: int) -> List[np.ndarray]:
+    """Returns rows of the k training documents with the highest inner product with each query vector
+    """
+    scores = matrix.inner_products(*matrix.to_query_matrix(query_vectors))
+    return top_k_rows(scores, k)
+
+
+def _worker_nearest_neighbours(args) -> List[np.ndarray]:
+    query_vectors, k = args
+    return _nearest_neighbours(_worker_matrix, query_vectors, k)
+
+
 class kNN_reuters:
     """KNN implementation for Reuters collections for Topic prediction
     """
 
     def __init__(self, k: int = 5):
-        self.k = 5
+        self.k = k
         return
 
     def fit(self, X, Y, docIDs):
@@ -33,6 +59,11 @@ class kNN_reuters:
             self.dictionary, self.X_train.to_list(), self.docIDs_train.to_list()
         )
         self.vsm = VectorSpaceModel(self.index)
+
+        # Topics of each training document by row, rows follow the docIDs of the index
+        self.topics_train = self.Y_train.to_list()
+        self.docID_rows = {docID: i for (i, docID) in enumerate(self.index.docIDs)}
+        self.matrix = TermDocumentMatrix(self.index)
         return
 
     def predict(self, X) -> List[str]:
@@ -47,11 +78,81 @@ class kNN_reuters:
         # Get docID of nearest neighbours
         nn = self.vsm.search(X, limit=self.k)
 
+        return self._vote([self.docID_rows[docID] for docID in nn])
+
+    def predict_many(
+        self, X, chunk_size: int = 256, n_processes: int = 1
+    ) -> List[List[str]]:
+        """Predict topics of many document bodies at once. Term frequencies of all documents are scored against the
+        training TF-IDF matrix by chunks, only keeping the k nearest neighbours of each document
+        
+        Arguments:
+            X {[type]} -- Document bodies to predict topics
+        
+        Keyword Arguments:
+            chunk_size {int} -- Amount of documents scored at once (default: {256})
+            n_processes {int} -- Amount of processes to score chunks with (default: {1})
+        
+        Returns:
+            List[List[str]] -- Predicted list of topics for each document
+        """
+        # Query vectors of term frequencies after the dictionary preprocessing
+        query_vectors = [
+            dict(Counter(self.dictionary.preprocess_document(doc))) for doc in X
+        ]
+        chunks = [
+            (query_vectors[i : i + chunk_size], self.k)
+            for i in range(0, len(query_vectors), chunk_size)
+        ]
+
+        if n_processes > 1:
+            with Pool(n_processes, initializer=_init_worker, initargs=(self.matrix,)) as pool:
+                neighbours = pool.map(_worker_nearest_neighbours, chunks)
+        else:
+            neighbours = [
+                _nearest_neighbours(self.matrix, chunk, k) for (chunk, k) in chunks
+            ]
+
+        return [self._vote(rows) for chunk in neighbours for rows in chunk]
+
+    def predict_from_graph(
+        self, docIDs, similarity_graph: DocumentSimilarityGraph
+    ) -> List[List[str]]:
+        """Predict topics of documents of the collection from their precomputed most similar documents, without any
+        search. Neighbours are the k most similar training documents among the neighbours stored in the graph
+        
+        Arguments:
+            docIDs {[type]} -- Document ids to predict topics, from the collection the graph was built on
+            similarity_graph {DocumentSimilarityGraph} -- Similarity graph of the whole collection
+        
+        Returns:
+            List[List[str]] -- Predicted list of topics for each document, None if no training document is in its
+                neighbours
+        """
+        predictions = []
+        for docID in docIDs:
+            rows = [
+                self.docID_rows[neighbour]
+                for (neighbour, _) in similarity_graph.get_similar(docID)
+                if neighbour in self.docID_rows
+            ][: self.k]
+            predictions.append(self._vote(rows) if len(rows) > 0 else None)
+
+        return predictions
+
+    def _vote(self, rows) -> List[str]:
+        """Topic is chosen as most common topics that make up at least 50% of topics of the nearest neighbours
+        
+        Arguments:
+            rows {[type]} -- Rows of the nearest neighbours in the training data
+        
+        Returns:
+            List[str] -- Predicted list of topics
+        """
         # Create list of concatenation of all topics, including duplicates
         topics = []
-        for docID in nn:
-            index = self.docIDs_train[self.docIDs_train == docID].index[0]
-            topics += self.Y_train.iloc[index]
+        for row in rows:
+            topics += self.topics_train[row]
 
         # Assign prediction as most common topics that make up at least 50% of the topic labels
         n = len(topics)
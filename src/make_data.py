@@ -2,12 +2,21 @@
 
 from bigram_language_model import BigramLanguageModel
 from dictionary import Dictionary
+from document_similarity import DocumentSimilarityGraph
+from document_store import DocumentStore
 from inverted_index import InvertedIndex
 from kNN_reuters import kNN_reuters
-from preprocessing import preprocess_uo_courses, preprocess_reuters_all
+from preprocessing import preprocess_uo_courses, preprocess_reuters_all, find_near_duplicates
+from query_expansion import SynonymTable
+from snippets import SnippetIndex
+from term_association import TermAssociationIndex
+from topic_index import TopicIndex
 
 import argparse
+import nltk
+import numpy as np
 import os.path
+import pandas as pd
 from pathlib import Path
 import pickle
 from pytictoc import TicToc
@@ -19,6 +28,9 @@ if __name__ == "__main__":
     # Parse cmd arguments
     parser = argparse.ArgumentParser(description='Preprocess the data and create models')
     parser.add_argument('--knn', action='store_true')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--dedup', action='store_true')
+    parser.add_argument('--shards', type=int, default=0)
     args = parser.parse_args()
 
     # Path to store preprocessed models and data
@@ -37,10 +49,45 @@ if __name__ == "__main__":
     )
     reuters_folder_path = os.path.join(file_path, "../collections/raw/reuters21578")
     reuters_out_path = os.path.join(file_path, "../collections/processed/reuters.csv")
+    uo_courses_store_path = os.path.join(
+        file_path, "../collections/processed/UofO_Courses_store"
+    )
+    reuters_store_path = os.path.join(file_path, "../collections/processed/reuters_store")
+    reuters_duplicates_out_path = os.path.join(
+        file_path, "../collections/processed/reuters_duplicates.csv"
+    )
     reuters_index_path = os.path.join(file_path, "../models/indexes/reuters_index.pkl")
+    uo_similarity_graph_path = os.path.join(
+        file_path, "../models/indexes/UofO_courses_similarity_graph.pkl"
+    )
+    reuters_shards_path = os.path.join(file_path, "../models/indexes/reuters_shards")
+    reuters_topic_index_path = os.path.join(
+        file_path, "../models/indexes/reuters_topic_index.pkl"
+    )
+    uo_snippet_index_path = os.path.join(
+        file_path, "../models/indexes/UofO_courses_snippet_index.pkl"
+    )
+    reuters_snippet_index_path = os.path.join(
+        file_path, "../models/indexes/reuters_snippet_index.pkl"
+    )
+    reuters_similarity_graph_path = os.path.join(
+        file_path, "../models/indexes/reuters_similarity_graph.pkl"
+    )
     reuters_bigram_model_path = os.path.join(
         file_path, "../models/bigram_language_models/reuters_bigram_model.pkl"
     )
+    uo_synonym_table_path = os.path.join(
+        file_path, "../models/synonym_tables/UofO_synonym_table.pkl"
+    )
+    reuters_synonym_table_path = os.path.join(
+        file_path, "../models/synonym_tables/reuters_synonym_table.pkl"
+    )
+    uo_term_associations_path = os.path.join(
+        file_path, "../models/term_associations/UofO_term_associations.pkl"
+    )
+    reuters_term_associations_path = os.path.join(
+        file_path, "../models/term_associations/reuters_term_associations.pkl"
+    )
     reuters_topics_out_path = os.path.join(
         file_path, "../collections/processed/reuters_with_topics.csv"
     )
@@ -52,6 +99,12 @@ if __name__ == "__main__":
     Path(os.path.join(file_path, "../models/indexes/")).mkdir(
         parents=True, exist_ok=True
     )
+    Path(os.path.join(file_path, "../models/synonym_tables/")).mkdir(
+        parents=True, exist_ok=True
+    )
+    Path(os.path.join(file_path, "../models/term_associations/")).mkdir(
+        parents=True, exist_ok=True
+    )
 
     tictoc = TicToc()
     t = TicToc()
@@ -63,9 +116,37 @@ if __name__ == "__main__":
     print("Preprocessing UO courses html")
     courses = preprocess_uo_courses(uo_courses_file_path)
     courses.to_csv(uo_courses_out_path, index=False)
+    DocumentStore.write(courses, uo_courses_store_path)
     print("Preprocessing Reuters collection")
     reuters_texts = preprocess_reuters_all(reuters_folder_path)
     reuters_texts.to_csv(reuters_out_path, index=False)
+    DocumentStore.write(reuters_texts, reuters_store_path, list_columns=["topics"])
+    t.toc()
+
+    # Find near duplicate Reuters documents, e.g. wire updates of the same story
+    t.tic()
+    print("\nFind near duplicate documents Reuters collection")
+    duplicate_groups = find_near_duplicates(
+        reuters_texts["body"].to_list(), reuters_texts["docID"].to_list()
+    )
+    pd.DataFrame(
+        [
+            {"group": i, "docID": docID, "representative": group[0]}
+            for (i, group) in enumerate(duplicate_groups)
+            for docID in group
+        ],
+        columns=["group", "docID", "representative"],
+    ).to_csv(reuters_duplicates_out_path, index=False)
+    print(
+        f"Found {len(duplicate_groups)} groups of near duplicates with "
+        f"{sum(len(group) - 1 for group in duplicate_groups)} redundant documents"
+    )
+
+    # Only the representative of each group is indexed if deduplicating, other models use all documents
+    reuters_index_texts = reuters_texts
+    if args.dedup:
+        duplicate_docIDs = {docID for group in duplicate_groups for docID in group[1:]}
+        reuters_index_texts = reuters_texts.loc[~reuters_texts["docID"].isin(duplicate_docIDs)]
     t.toc()
 
     # Create dictionary
@@ -73,7 +154,7 @@ if __name__ == "__main__":
     print("\nCreate dictionary UO courses")
     courses_dictionary = Dictionary(courses["body"].to_list())
     print("Create dictionary Reuters collection")
-    reuters_dictionary = Dictionary(reuters_texts["body"].to_list())
+    reuters_dictionary = Dictionary(reuters_index_texts["body"].to_list())
     t.toc()
 
     # Create inverted index
@@ -87,22 +168,108 @@ if __name__ == "__main__":
     print("Create inverted index Reuters collection")
     reuters_index = InvertedIndex(
         reuters_dictionary,
-        reuters_texts["body"].to_list(),
-        reuters_texts["docID"].to_list(),
+        reuters_index_texts["body"].to_list(),
+        reuters_index_texts["docID"].to_list(),
     )
     pickle.dump(reuters_index, open(reuters_index_path, "wb"))
+
+    # Partition Reuters documents into shards of consecutive docIDs, each with its own dictionary and index
+    if args.shards > 0:
+        print(f"Create {args.shards} inverted index shards Reuters collection")
+        Path(reuters_shards_path).mkdir(parents=True, exist_ok=True)
+        for old_shard_path in Path(reuters_shards_path).glob("reuters_index_shard_*.pkl"):
+            old_shard_path.unlink()
+        for (i, rows) in enumerate(np.array_split(np.arange(len(reuters_index_texts)), args.shards)):
+            shard_texts = reuters_index_texts.iloc[rows]
+            shard_index = InvertedIndex(
+                Dictionary(shard_texts["body"].to_list()),
+                shard_texts["body"].to_list(),
+                shard_texts["docID"].to_list(),
+            )
+            pickle.dump(
+                shard_index,
+                open(os.path.join(reuters_shards_path, f"reuters_index_shard_{i}.pkl"), "wb"),
+            )
+
+    print("Create topic index Reuters collection")
+    reuters_doc_topics = dict(zip(reuters_texts["docID"], reuters_texts["topics"]))
+    reuters_topic_index = TopicIndex(
+        reuters_index.docIDs, [reuters_doc_topics[docID] for docID in reuters_index.docIDs]
+    )
+    pickle.dump(reuters_topic_index, open(reuters_topic_index_path, "wb"))
+
+    if args.dedup:
+        # Postings of the removed documents are the ones the full index would also have
+        n_postings = sum(len(postings) for postings in reuters_index.index.values())
+        n_removed_postings = sum(
+            len(set(reuters_dictionary.preprocess_document(text)))
+            for text in reuters_texts.loc[reuters_texts["docID"].isin(duplicate_docIDs), "body"]
+        )
+        print(
+            f"Removed {len(reuters_texts) - len(reuters_index_texts)} near duplicate documents and "
+            f"{n_removed_postings} postings ({n_removed_postings / (n_postings + n_removed_postings):.1%} of the index)"
+        )
+    t.toc()
+
+    # Create snippet indexes
+    t.tic()
+    print("\nCreate snippet index UO courses")
+    uo_snippet_index = SnippetIndex(
+        courses_index, courses["body"].to_list(), courses["docID"].to_list()
+    )
+    pickle.dump(uo_snippet_index, open(uo_snippet_index_path, "wb"))
+    print("Create snippet index Reuters collection")
+    reuters_snippet_index = SnippetIndex(
+        reuters_index, reuters_texts["body"].to_list(), reuters_texts["docID"].to_list()
+    )
+    pickle.dump(reuters_snippet_index, open(reuters_snippet_index_path, "wb"))
+    t.toc()
+
+    # Create document similarity graphs
+    t.tic()
+    print("\nCreate document similarity graph UO courses")
+    uo_similarity_graph = DocumentSimilarityGraph(courses_index)
+    pickle.dump(uo_similarity_graph, open(uo_similarity_graph_path, "wb"))
+    print("Create document similarity graph Reuters collection")
+    reuters_similarity_graph = DocumentSimilarityGraph(reuters_index)
+    pickle.dump(reuters_similarity_graph, open(reuters_similarity_graph_path, "wb"))
     t.toc()
 
     # Create bigram language models
     t.tic()
     print("\nCreate bigram language model for UO courses")
-    uo_bigram_model = BigramLanguageModel(courses["body"].to_list())
+    uo_bigram_model = BigramLanguageModel(
+        courses["body"].to_list(), n_processes=args.processes
+    )
     pickle.dump(uo_bigram_model, open(uo_bigram_model_path, "wb"))
     print("Create bigram language model Reuters collections")
-    reuter_bigram_model = BigramLanguageModel(reuters_texts["body"].to_list())
+    reuter_bigram_model = BigramLanguageModel(
+        reuters_texts["body"].to_list(), n_processes=args.processes
+    )
     pickle.dump(reuter_bigram_model, open(reuters_bigram_model_path, "wb"))
     t.toc()
 
+    # Create WordNet synonym tables restricted to the vocabulary of each collection
+    t.tic()
+    nltk.download("wordnet", quiet=True)
+    print("\nCreate synonym table for UO courses")
+    uo_synonym_table = SynonymTable(courses_dictionary.words_raw)
+    pickle.dump(uo_synonym_table, open(uo_synonym_table_path, "wb"))
+    print("Create synonym table for Reuters collection")
+    reuters_synonym_table = SynonymTable(reuters_dictionary.words_raw)
+    pickle.dump(reuters_synonym_table, open(reuters_synonym_table_path, "wb"))
+    t.toc()
+
+    # Create term association indexes from co-occurrences in documents
+    t.tic()
+    print("\nCreate term associations for UO courses")
+    uo_term_associations = TermAssociationIndex(courses_index)
+    pickle.dump(uo_term_associations, open(uo_term_associations_path, "wb"))
+    print("Create term associations for Reuters collection")
+    reuters_term_associations = TermAssociationIndex(reuters_index)
+    pickle.dump(reuters_term_associations, open(reuters_term_associations_path, "wb"))
+    t.toc()
+
     # kNN predict topics
 
     if  args.knn:
@@ -124,10 +291,24 @@ if __name__ == "__main__":
         knn = kNN_reuters(5)
         knn.fit(X_train, Y_train, docIDs_train)
 
-        # Get predictions
-        predicted_topics = [knn.predict(X) for X in X_test]
+        # Get predictions from the similarity graph, documents without training neighbours in the graph are scored
+        # against the training documents by chunks
+        docIDs_test = docIDs.loc[~train_index].reset_index(drop=True)
+        predicted_topics = knn.predict_from_graph(docIDs_test, reuters_similarity_graph)
+        missing = [i for (i, topics) in enumerate(predicted_topics) if topics is None]
+        missing_topics = knn.predict_many(X_test.iloc[missing], n_processes=args.processes)
+        for (i, topics) in zip(missing, missing_topics):
+            predicted_topics[i] = topics
         reuters_texts.loc[~train_index, 'topics'] = predicted_topics
         reuters_texts.to_csv(reuters_topics_out_path, index=False)
+        DocumentStore.write(reuters_texts, reuters_store_path, list_columns=["topics"])
+
+        # Topic index with the predicted topics
+        reuters_doc_topics = dict(zip(reuters_texts["docID"], reuters_texts["topics"]))
+        reuters_topic_index = TopicIndex(
+            reuters_index.docIDs, [reuters_doc_topics[docID] for docID in reuters_index.docIDs]
+        )
+        pickle.dump(reuters_topic_index, open(reuters_topic_index_path, "wb"))
         t.toc()
 
     print("\nCompleted preprocessing total time:")
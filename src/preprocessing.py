@@ -1,9 +1,11 @@
 # Module 2 - Corpus Preprocessing
 # Purpose: Convert a collection of documents into a formatted corpus
 
+import numpy as np
 import pandas as pd
 import re
 from bs4 import BeautifulSoup
+from typing import List
 
 
 # TODO: French parts of title still showing up
@@ -158,3 +160,113 @@ def preprocess_reuters_all(folder_path: str) -> pd.DataFrame:
     text_dfs = pd.concat(text_dfs)
 
     return text_dfs
+
+
+def _shingle_hashes(text: str, word_ids: dict, shingle_size: int) -> np.ndarray:
+    """ Hashes every sequence of shingle_size consecutive words of a text to an integer below 2^31 - 1
+    
+    Arguments:
+        text {str} -- Document text
+        word_ids {dict} -- Ids of the words seen so far, updated with new words. Id of the empty string pads texts
+            shorter than a shingle, as no word is empty
+        shingle_size {int} -- Amount of words per shingle
+    
+    Returns:
+        np.ndarray -- Distinct shingle hashes of the text
+    """
+    words = re.findall(r"\w+", text.lower())
+    ids = np.array([word_ids.setdefault(word, len(word_ids)) for word in words], dtype=np.uint64)
+    if len(ids) < shingle_size:
+        padding = np.full(shingle_size - len(ids), word_ids.setdefault("", len(word_ids)), dtype=np.uint64)
+        ids = np.concatenate([ids, padding])
+
+    # Polynomial hash of the word ids of each shingle
+    hashes = np.zeros(len(ids) - shingle_size + 1, dtype=np.uint64)
+    for i in range(shingle_size):
+        hashes = (hashes * np.uint64(1000003) + ids[i : len(ids) - shingle_size + 1 + i]) % np.uint64(2 ** 31 - 1)
+    return np.unique(hashes)
+
+
+def find_near_duplicates(
+    texts: List[str],
+    docIDs: list,
+    threshold: float = 0.8,
+    shingle_size: int = 3,
+    n_hashes: int = 128,
+    n_bands: int = 16,
+    seed: int = 0,
+) -> List[list]:
+    """ Clusters near duplicate documents, i.e. with a Jaccard similarity of their word shingles above the threshold.
+    Similarities are estimated with MinHash signatures, and only documents sharing a band of their signature in the
+    locality sensitive hashing (LSH) tables are compared, so that the time is roughly linear in the amount of documents
+    
+    Arguments:
+        texts {List[str]} -- Document texts
+        docIDs {list} -- Document ids of the texts
+    
+    Keyword Arguments:
+        threshold {float} -- Minimum estimated Jaccard similarity of near duplicates (default: {0.8})
+        shingle_size {int} -- Amount of words per shingle (default: {3})
+        n_hashes {int} -- Length of the MinHash signatures (default: {128})
+        n_bands {int} -- Amount of LSH bands, n_hashes must be a multiple of it (default: {16})
+        seed {int} -- Random seed of the hash functions (default: {0})
+    
+    Returns:
+        List[list] -- Groups of near duplicate docIDs in order of the texts, the first one can represent the group.
+            Documents without near duplicates are not in any group
+    """
+    n_docs = len(texts)
+    prime = np.uint64(2 ** 31 - 1)
+
+    # Shingles of all documents one after the other
+    word_ids = {"": 0}
+    shingles = [_shingle_hashes(str(text), word_ids, shingle_size) for text in texts]
+    starts = np.cumsum([0] + [len(doc_shingles) for doc_shingles in shingles[:-1]])
+    shingles = np.concatenate(shingles) if n_docs > 0 else np.empty(0, dtype=np.uint64)
+
+    # MinHash signatures, one random hash function (a * x + b) mod prime at a time
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2 ** 31 - 1, size=n_hashes).astype(np.uint64)
+    b = rng.randint(0, 2 ** 31 - 1, size=n_hashes).astype(np.uint64)
+    signatures = np.empty((n_docs, n_hashes), dtype=np.uint64)
+    for i in range(n_hashes):
+        signatures[:, i] = np.minimum.reduceat((a[i] * shingles + b[i]) % prime, starts)
+
+    # Union find of the documents
+    parents = np.arange(n_docs)
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    # Documents with the same band are compared to every earlier document of the bucket not yet in their group
+    rows = n_hashes // n_bands
+    for band in range(n_bands):
+        band_signatures = np.ascontiguousarray(signatures[:, band * rows : (band + 1) * rows])
+        keys = band_signatures.view(np.dtype((np.void, band_signatures.dtype.itemsize * rows))).ravel()
+        _, buckets, bucket_sizes = np.unique(keys, return_inverse=True, return_counts=True)
+        buckets = buckets.ravel()
+
+        # Documents of buckets with several documents, sorted by bucket then by document
+        shared = np.flatnonzero(bucket_sizes[buckets] > 1)
+        shared = shared[np.argsort(buckets[shared], kind="stable")]
+        bucket_starts = np.flatnonzero(np.diff(buckets[shared], prepend=-1))
+        for members in np.split(shared, bucket_starts[1:]):
+            for (j, doc) in enumerate(members[1:], 1):
+                earlier = np.array([i for i in members[:j] if find(i) != find(doc)], dtype=np.int64)
+                if len(earlier) == 0:
+                    continue
+                similarities = (signatures[earlier] == signatures[doc]).mean(axis=1)
+                for i in earlier[similarities >= threshold]:
+                    root_i, root_doc = find(i), find(doc)
+                    if root_i != root_doc:
+                        parents[max(root_i, root_doc)] = min(root_i, root_doc)
+
+    # Groups in order of the texts, the root of a group is its first document
+    groups = {}
+    for i in range(n_docs):
+        groups.setdefault(find(i), []).append(docIDs[i])
+
+    return [group for group in groups.values() if len(group) > 1]
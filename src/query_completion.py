@@ -1,23 +1,83 @@
 # Module 2 - Query Completion Module
 # Purpose: Provide suggestions as a list of possible completions to a query
 
-# TODO: calculate_one_step prob can just be calculated using P(w_n|w_n-1) and doens't require whole sequence
-
 from bigram_language_model import BigramLanguageModel
 from sentence_preprocessing import tokenize
+import numpy as np
 from typing import List, Tuple
 
 
+class PrefixTrie:
+    """Trie over a vocabulary where each node caches its k most likely completions, so that completing a partial word
+    only walks down the characters of the prefix. Nodes are represented as [{character: child node}, [(word, score)]]
+    """
+
+    def __init__(self, word_scores: List[Tuple[str, float]], k: int = 10):
+        self.k = k
+        self.root = [{}, []]
+
+        # Inserting words from most to least likely keeps the cached completions of every node sorted
+        for (word, score) in sorted(word_scores, key=lambda pair: (-pair[1], pair[0])):
+            self.add(word, score)
+
+        return
+
+    def add(self, word: str, score: float) -> None:
+        """Inserts word, it must be less likely than every word inserted before it
+        
+        Arguments:
+            word {str} -- Word to insert
+            score {float} -- Score of the word, e.g. its prior probability
+        """
+        node = self.root
+        for character in [""] + list(word):
+            if character != "":
+                node = node[0].setdefault(character, [{}, []])
+            if len(node[1]) < self.k:
+                node[1].append((word, score))
+        return
+
+    def complete(self, prefix: str, k: int = None) -> List[Tuple[str, float]]:
+        """Returns the most likely words starting with prefix
+        
+        Arguments:
+            prefix {str} -- Start of word
+        
+        Keyword Arguments:
+            k {int} -- Amount of words to return, at most the k of the trie (default: {None})
+        
+        Returns:
+            List[Tuple[str, float]] -- List of (word, score) sorted by decreasing score
+        """
+        node = self.root
+        for character in prefix:
+            if character not in node[0]:
+                return []
+            node = node[0][character]
+        return node[1][:k]
+
+
 class QueryCompleter:
     """Query completer that uses a bigram language model to find suggestions for completing given queries
     """
 
     def __init__(self, bigram_language_model: BigramLanguageModel):
         self.bigram_language_model = bigram_language_model
+
+        # Trie over the vocabulary to complete partially typed words, ranked by prior probability
+        vocabulary = self.bigram_language_model.get_vocabulary()
+        self.prefix_trie = PrefixTrie(
+            [(word, self.bigram_language_model.get_prior(word)) for word in vocabulary]
+        )
         return
 
     def complete_query(
-        self, query: str, limit: int = 5, include_score: bool = False
+        self,
+        query: str,
+        limit: int = 5,
+        include_score: bool = False,
+        depth: int = 1,
+        beam_width: int = 5,
     ) -> List[str]:
         """Finds suggestions for completing the query 
         
@@ -26,6 +86,8 @@ class QueryCompleter:
 
         Keyword Arguments:
             limit {int} -- Top amount of queries to return (default: {5})
+            depth {int} -- Amount of words to add to the query (default: {1})
+            beam_width {int} -- Amount of partial completions kept at each step when depth > 1 (default: {5})
         
         Returns:
             List[str] -- List of suggested queries in form of (sentence, probability)
@@ -35,7 +97,23 @@ class QueryCompleter:
 
         query_tokens = tokenize(query)
 
-        suggestions = self.calculate_one_step_prob(query_tokens, limit=limit)
+        # Last word is still being typed if it isn't followed by a space and isn't a known word
+        if (
+            len(query_tokens) > 0
+            and not query[-1].isspace()
+            and self.bigram_language_model.get_prior(query_tokens[-1]) == 0
+        ):
+            return self.complete_word(query, limit=limit, include_score=include_score)
+
+        if depth > 1:
+            suggestions = self.calculate_multi_step_prob(
+                query_tokens, depth=depth, beam_width=beam_width, limit=limit
+            )
+            suggestions = [
+                (sent_tokens, 10 ** log_proba) for (sent_tokens, log_proba) in suggestions
+            ]
+        else:
+            suggestions = self.calculate_one_step_prob(query_tokens, limit=limit)
         suggestions = [
             (" ".join(sent_tokens), proba) for (sent_tokens, proba) in suggestions
         ]
@@ -45,8 +123,52 @@ class QueryCompleter:
 
         return suggestions
 
+    def complete_word(
+        self, query: str, limit: int = 5, include_score: bool = False
+    ) -> List[str]:
+        """Finds suggestions for completing the partially typed last word of the query. Words that follow the previous word
+        in the bigram model come first ranked by P(word | previous word), then the most likely words by prior probability
+        
+        Arguments:
+            query {str} -- Query ending with a partial word
+
+        Keyword Arguments:
+            limit {int} -- Top amount of queries to return (default: {5})
+        
+        Returns:
+            List[str] -- List of suggested queries in form of (sentence, probability)
+        """
+        query_tokens = tokenize(query)
+        if len(query_tokens) == 0:
+            return []
+        prefix = query_tokens[-1]
+
+        # Completions conditioned on the previous word
+        completions = []
+        if len(query_tokens) > 1:
+            completions = self.bigram_language_model.get_top_w2_with_prefix(
+                query_tokens[-2], prefix, k=limit
+            )
+
+        # Fill up with most likely words overall
+        seen = set(word for (word, _) in completions)
+        for (word, proba) in self.prefix_trie.complete(prefix):
+            if len(completions) >= limit:
+                break
+            if word not in seen:
+                completions.append((word, proba))
+
+        suggestions = [
+            (" ".join(query_tokens[:-1] + [word]), proba) for (word, proba) in completions
+        ]
+
+        if not include_score:
+            suggestions = [query for (query, _) in suggestions]
+
+        return suggestions
+
     def calculate_one_step_prob(
-        self, sent_tokens: List[str], limit: int = 5
+        self, sent_tokens: List[str], limit: int = 5, smoothing: float = 1e-6
     ) -> List[Tuple[List[str], float]]:
         """Calculates the one word predictions for next word in the sentence
         
@@ -55,33 +177,90 @@ class QueryCompleter:
         
         Keyword Arguments:
             limit {int} -- Top amount of queries to return (default: {5})
+            smoothing {float} -- Smoothing parameter in case of 0 probabilities, same as in calculate_seq_proba (default: {1e-6})
         
         Returns:
             List[Tuple[List[str], float]] -- List of most likely one step query completions in form of (sentence, probability)
         """
         last_word = sent_tokens[-1]
 
-        # Get possible next words from last word in sentence
-        next_words = self.bigram_language_model.get_w2(last_word)
+        # Get most likely next words from last word in sentence, already sorted from highest to lowest prob
+        next_words = self.bigram_language_model.get_top_w2(last_word, k=limit)
 
         if len(next_words) == 0:
             return []
 
+        # Probability of the sentence so far is only calculated once
+        proba = self.bigram_language_model.calculate_seq_proba(sent_tokens)
+
         # Get probabilities of adding each next word P(next word | words before) = P(next_word | word at n-1) * proba
         results = [
-            (
-                sent_tokens + [next_word],
-                self.bigram_language_model.calculate_seq_proba(
-                    sent_tokens + [next_word]
-                ),
-            )
-            for next_word in next_words
+            (sent_tokens + [next_word], proba * (next_proba + smoothing))
+            for (next_word, next_proba) in next_words
         ]
 
-        # Sort by highest to lowest prob
-        results.sort(key=lambda tup: tup[1], reverse=True)
+        return results
 
-        # Limit results
-        results = results[:limit]
+    def calculate_multi_step_prob(
+        self,
+        sent_tokens: List[str],
+        depth: int = 2,
+        beam_width: int = 5,
+        limit: int = 5,
+        smoothing: float = 1e-6,
+    ) -> List[Tuple[List[str], float]]:
+        """Calculates the most likely completions of up to depth words with a beam search over the bigram model.
+        Only the beam_width most likely next words of the beam_width best partial completions are expanded at each step,
+        so at most beam_width * beam_width sequences are scored per step whatever the size of the vocabulary
+        
+        Arguments:
+            sent_tokens {List[str]} -- List of tokens to complete
+        
+        Keyword Arguments:
+            depth {int} -- Amount of words to add (default: {2})
+            beam_width {int} -- Amount of partial completions kept at each step (default: {5})
+            limit {int} -- Top amount of queries to return (default: {5})
+            smoothing {float} -- Smoothing parameter in case of 0 probabilities, same as in calculate_seq_proba (default: {1e-6})
+        
+        Returns:
+            List[Tuple[List[str], float]] -- List of most likely completions in form of (sentence, log10 probability),
+                completions stop early if the last word has no next word
+        """
+        # Partial completions as (log probability, added words)
+        log_proba = self.bigram_language_model.calculate_seq_log_proba(
+            sent_tokens, smoothing=smoothing
+        )
+        beam = [(log_proba, [])]
+        completed = []
+
+        for _ in range(depth):
+            candidates = []
+            for (log_proba, words) in beam:
+                last_word = words[-1] if len(words) > 0 else sent_tokens[-1]
+                next_words = self.bigram_language_model.get_top_w2(last_word, k=beam_width)
+
+                # No possible next word, the completion ends here
+                if len(next_words) == 0:
+                    if len(words) > 0:
+                        completed.append((log_proba, words))
+                    continue
+
+                for (next_word, next_proba) in next_words:
+                    candidates.append(
+                        (log_proba + np.log10(next_proba + smoothing), words + [next_word])
+                    )
+
+            # Keep most likely partial completions, ties sorted alphabetically
+            candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+            beam = candidates[:beam_width]
+            if len(beam) == 0:
+                break
+
+        completed.extend(beam)
+        completed.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+        results = [
+            (sent_tokens + words, float(log_proba)) for (log_proba, words) in completed[:limit]
+        ]
 
         return results
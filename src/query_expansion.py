@@ -2,41 +2,191 @@ import dictionary
 import copy
 import itertools
 import nltk
-nltk.download('wordnet')
+import time
+# WordNet is only read on first access, which only happens when building a SynonymTable
 from nltk.corpus import wordnet
 
+# Table of the query terms expanded without a precomputed synonym table, built lazily and kept for the process
+_fallback_synonym_table = None
 
-def expand_query(user_query, model):
+
+class SynonymTable:
+    '''
+    WordNet senses of the words of a vocabulary, so that queries can be expanded without accessing WordNet.
+    Senses are stored by synset name as (part of speech, lemma names, lemma names of the first hypernym,
+    distance to each hypernym ancestor), the distances give the same path similarity as WordNet.
+    WordNet must be downloaded to build the table, e.g. nltk.download('wordnet')
+    '''
+
+    def __init__(self, vocabulary):
+        self.term_synsets = {}
+        self.synsets = {}
+        # Similarities computed at query time are kept for later queries, by pair of synset names
+        self.similarity_cache = {}
+        for term in vocabulary:
+            self.add_term(term)
+        return
+
+    def add_term(self, term):
+        '''
+        adds senses of term, ordered by prevalence of use like wordnet.synsets
+        '''
+        term_synsets = wordnet.synsets(term)
+        if len(term_synsets) < 1:
+            return
+        self.term_synsets[term] = [syn.name() for syn in term_synsets]
+
+        for syn in term_synsets:
+            if syn.name() in self.synsets:
+                continue
+            hypernyms = syn.hypernyms()
+            hypernym_lemmas = [x.name() for x in hypernyms[0].lemmas()] if len(hypernyms) > 0 else []
+            self.synsets[syn.name()] = (
+                syn.pos(),
+                get_synonyms(syn),
+                hypernym_lemmas,
+                get_hypernym_distances(syn),
+            )
+        return
+
+    def get_synsets(self, term):
+        '''
+        gets names of the senses of term, empty if term isn't in the table
+        '''
+        return self.term_synsets.get(term, [])
+
+    def get_synonyms(self, syn):
+        '''
+        gets synonyms from synset name
+        '''
+        return self.synsets[syn][1]
+
+    def get_hypernym_synonyms(self, syn):
+        '''
+        gets synonyms of the first hypernym of synset name, empty if it has no hypernym
+        '''
+        return self.synsets[syn][2]
+
+    def path_similarity(self, syn1, syn2):
+        '''
+        path similarity of 2 synset names, same as Synset.path_similarity of syn1 with syn2 in the nltk version of the
+        requirements: a root is simulated when syn1 is not a noun, so the result depends on the order of the synsets
+        '''
+        if syn1 == syn2:
+            return 1.0
+        pair = (syn1, syn2)
+        if pair not in self.similarity_cache:
+            self.similarity_cache[pair] = self._path_similarity(syn1, syn2)
+        return self.similarity_cache[pair]
+
+    def _path_similarity(self, syn1, syn2):
+        pos1, _, _, distances1 = self.synsets[syn1]
+        _, _, _, distances2 = self.synsets[syn2]
+
+        if len(distances1) > len(distances2):
+            distances1, distances2 = distances2, distances1
+        distance = min(
+            [d1 + distances2[ancestor] for ancestor, d1 in distances1.items() if ancestor in distances2],
+            default=None,
+        )
+
+        # Verbs and adjectives don't share a root, a fake root is added above the deepest ancestor if syn1 isn't a noun
+        if pos1 != 'n':
+            root_distance = max(distances1.values()) + max(distances2.values()) + 2
+            distance = root_distance if distance is None else min(distance, root_distance)
+
+        if distance is None:
+            return None
+        return 1.0 / (distance + 1)
+
+
+def get_hypernym_distances(syn):
+    '''
+    gets shortest distance from synset to each of its hypernym ancestors (including itself) by synset name
+    '''
+    distances = {}
+    queue = [(syn, 0)]
+    for s, depth in queue:
+        if s.name() in distances:
+            continue
+        distances[s.name()] = depth
+        queue.extend((hyp, depth + 1) for hyp in s.hypernyms() + s.instance_hypernyms())
+    return distances
+
+
+def expand_query(user_query, model, synonym_table=None, term_association_index=None):
     '''
     expands query using the rest of the methods in this library
     to get it back to a form usable by the retreival methods youill need to use: inter_model_2_boolean() or inter_model_2_vsm()
+    uses the precomputed synonym table of the collection if given, only terms of its vocabulary are expanded.
+    otherwise the query terms are added from WordNet to a table shared by all queries of the process
+    if a term association index of the collection is given, terms are expanded with the terms they co-occur with
+    in the collection instead of WordNet
     '''
     query = get_inter_model(user_query)
-    use_single = False
+
+    if term_association_index is not None:
+        query = expand_term_associations(query, term_association_index)
+        return inter_model_2_boolean(query, user_query) if model == "boolean" else inter_model_2_vsm(query)
+
+    if synonym_table is None:
+        synonym_table = get_fallback_synonym_table()
+        for term in query:
+            if not term[0] in synonym_table.term_synsets:
+                synonym_table.add_term(term[0])
     
     if len(query) > 1:
-        query = expand_term_multiple(query, similarity_threshold=0)
+        query = expand_term_multiple(query, synonym_table, similarity_threshold=0)
     elif len(query) == 1:
-        query = expand_term(query)
+        query = expand_term(query, synonym_table)
     
     if model == "boolean":
         return inter_model_2_boolean(query, user_query)
     elif model == "vsm":
         return inter_model_2_vsm(query)
 
-def expand_term(query, similarity_threshold=0.5, score=0.25):
+def get_fallback_synonym_table():
+    '''
+    gets the synonym table used when a collection has none (see make_data), downloads WordNet on first use if missing
+    '''
+    global _fallback_synonym_table
+    if _fallback_synonym_table is None:
+        try:
+            wordnet.ensure_loaded()
+        except LookupError:
+            if not nltk.download('wordnet', quiet=True):
+                raise LookupError(
+                    "WordNet could not be downloaded, build the synonym tables with make_data "
+                    "or run nltk.download('wordnet')"
+                )
+        _fallback_synonym_table = SynonymTable([])
+    return _fallback_synonym_table
+
+def expand_term_associations(query, term_association_index, limit=3):
+    '''
+    expands each query term with the limit terms associated the most with it in the collection
+    the associated terms are scored by their normalized pointwise mutual information with the query term
+    '''
+    query_terms = [x[0] for x in query]
+    for term in query:
+        for (associate, score) in term_association_index.get_associates(term[0], k=limit):
+            if score > 0 and not associate in [x[0] for x in term[1]] and not associate in query_terms:
+                term[1].append((associate, score))
+    return query
+
+def expand_term(query, synonym_table, similarity_threshold=0.5, score=0.25):
     '''
     expands single term query (no comparisons between query terms is performed)
     uses the first one as the synsets are ordered by prevalence of use
     if no synonyms of that sense exist, then a hypernym is offered
     '''
-    query_synset = wordnet.synsets(query[0][0])
+    query_synset = synonym_table.get_synsets(query[0][0])
     if len(query_synset) < 1:
         return query
     most_common_query_sense = query_synset[0]
-    expansion = [(x.name(), score) for x in most_common_query_sense.lemmas()]
+    expansion = [(x, score) for x in synonym_table.get_synonyms(most_common_query_sense)]
     if len(expansion) == 1:
-        expansion = [(x.name(), score) for x in most_common_query_sense.hypernyms()[0].lemmas()]
+        expansion = [(x, score) for x in synonym_table.get_hypernym_synonyms(most_common_query_sense)]
     
     for i in expansion:
         if i[0] != query[0][0]:
@@ -44,17 +194,22 @@ def expand_term(query, similarity_threshold=0.5, score=0.25):
     return query
     
     
-def expand_term_multiple(query, similarity_threshold=0.5, include_hypernyms=False):
+def expand_term_multiple(query, synonym_table, similarity_threshold=0.5, include_hypernyms=False, max_synsets=5, time_budget=0.1):
     '''
     gets finds the most similar word senses and marks them for use in the expanded query if similarity is past the threshold
     uses path similarity as similarity measure, as well as vsm scoring
+    only the max_synsets most common senses of each term are compared, once time_budget seconds are spent
+    the remaining term pairs are skipped and the query expanded so far is returned
     '''
+    start = time.perf_counter()
     
     for term_combo in itertools.combinations(query, 2):
-        ab_sense_pair, ab_similarity = get_most_similar_synsets(term_combo[0][0], term_combo[1][0])
+        if time.perf_counter() - start > time_budget:
+            break
+        ab_sense_pair, ab_similarity = get_most_similar_synsets(term_combo[0][0], term_combo[1][0], synonym_table, max_synsets)
         if ab_similarity > similarity_threshold:
-            term_a_synonyms = get_synonyms(ab_sense_pair[0])
-            term_b_synonyms = get_synonyms(ab_sense_pair[1])
+            term_a_synonyms = synonym_table.get_synonyms(ab_sense_pair[0])
+            term_b_synonyms = synonym_table.get_synonyms(ab_sense_pair[1])
             for syn in term_a_synonyms:
                 if not syn in [x[0] for x in term_combo[0][1]] and not syn in [x[0] for x in query]:
                     term_combo[0][1].append((syn, ab_similarity))
@@ -69,12 +224,13 @@ def get_synonyms(syns):
     '''
     return [x.name() for x in syns.lemmas()]
     
-def get_most_similar_synsets(term_1, term_2):
+def get_most_similar_synsets(term_1, term_2, synonym_table, max_synsets=None):
     '''
     takes in 2 terms, and finds a synset in each term's synsets with the greatest similarity
+    only the max_synsets most common synsets of each term are considered if given
     '''
-    term_1_syns = wordnet.synsets(term_1)
-    term_2_syns = wordnet.synsets(term_2)
+    term_1_syns = synonym_table.get_synsets(term_1)[:max_synsets]
+    term_2_syns = synonym_table.get_synsets(term_2)[:max_synsets]
     if len(term_1_syns) < 1 or len(term_2_syns) < 1:
         return None, -1
     max_similarity = 0
@@ -82,7 +238,7 @@ def get_most_similar_synsets(term_1, term_2):
     
     for syn1 in term_1_syns:
         for syn2 in term_2_syns:
-            similarity = syn1.path_similarity(syn2)
+            similarity = synonym_table.path_similarity(syn1, syn2)
             if not similarity: similarity = 0
             if similarity > max_similarity:
                 max_similarity = similarity
@@ -2,27 +2,35 @@
 # Purpose: Perform implicit query expansion using the relevance provided, within the VSM, using the Rocchio Algorithm
 
 
-# TODO: remove to_full_vector and move it to vector space model
-
-
+from collections import OrderedDict
 from inverted_index import InvertedIndex
-import numpy as np
-from typing import List, Tuple
+from typing import Dict, List, Set, Tuple
 
 
 class Rocchio:
+    """Rocchio algorithm on sparse vectors {term: weight}, documents are read from the forward index of the inverted index.
+    Sums of the judged document vectors are cached per feedback key (e.g. the query), and only the documents added or
+    removed since the last update are added or subtracted. Only the most recently used feedback keys are kept
+    """
+
     def __init__(
         self,
         index: InvertedIndex,
         alpha: float = 0.8,
         beta: float = 0.3,
         gamma: float = 0.1,
+        max_feedback_keys: int = 256,
     ):
         self.dictionary = index.dictionary
         self.index = index
         self.alpha = alpha
         self.beta = beta
         self.gamma = gamma
+        self.max_feedback_keys = max_feedback_keys
+
+        # Cached sums of document vectors in form of {(feedback key, relevant): (docIDs, {term: summed TF-IDF})}, least
+        # recently used first
+        self._feedback_sums = OrderedDict()
         return
 
     def update_query_vector(
@@ -30,6 +38,7 @@ class Rocchio:
         query_vector: List[Tuple[str, float]],
         relevant_doc_ids: set,
         non_relevant_doc_ids: set,
+        feedback_key=None,
     ) -> List[Tuple[str, float]]:
         """Updates query vector using Rocchio algorithm based on relevant documents
         
@@ -37,12 +46,14 @@ class Rocchio:
             query_vector {List[Tuple[str, float]]} -- Sparse query vector
             relevant_doc_ids {list} -- Relevant document ids
             non_relevant_doc_ids {list} -- Non relevant document ids
+
+        Keyword Arguments:
+            feedback_key {[type]} -- Key of the feedback sets, e.g. the query, to reuse the sums of document vectors of
+                the previous update with the same key (default: {None})
         
         Returns:
             List[Tuple[str, float]] -- Updated sparse query vector
         """
-        non_relevant_doc_ids = list(non_relevant_doc_ids)
-        relevant_doc_ids = list(relevant_doc_ids)
         nr_len = len(non_relevant_doc_ids)
         r_len = len(relevant_doc_ids)
 
@@ -50,54 +61,75 @@ class Rocchio:
         if r_len == 0 and nr_len == 0:
             return query_vector
 
-        # Get vector form of documents and queries
-        query_vector = self._to_full_vector(query_vector)
-        relevant_vectors = np.array(
-            [self.index.get_docID_vector(doc_id) for doc_id in relevant_doc_ids]
-        )
-        non_relevant_vectors = np.array(
-            [self.index.get_docID_vector(doc_id) for doc_id in non_relevant_doc_ids]
-        )
+        # Query terms that are not in the index are dropped
+        terms = self.index.get_terms()
+        updated_query_vector = {
+            term: weight for (term, weight) in query_vector if term in terms
+        }
 
         # Rocchio algorithm for update
-        relevant_vector = relevant_vectors.sum(axis=0)
-        non_relevant_vector = non_relevant_vectors.sum(axis=0)
-        updated_query_vector = query_vector
         if r_len > 0:
-            updated_query_vector = (
-                query_vector + self.beta * (1 / r_len) * relevant_vector
-            )
+            relevant_vector = self._get_vectors_sum(feedback_key, True, relevant_doc_ids)
+            for term, weight in relevant_vector.items():
+                updated_query_vector[term] = (
+                    updated_query_vector.get(term, 0) + self.beta * (1 / r_len) * weight
+                )
         if nr_len > 0:
-            updated_query_vector = (
-                updated_query_vector - self.gamma * (1 / nr_len) * non_relevant_vector
+            non_relevant_vector = self._get_vectors_sum(
+                feedback_key, False, non_relevant_doc_ids
             )
+            for term, weight in non_relevant_vector.items():
+                updated_query_vector[term] = (
+                    updated_query_vector.get(term, 0) - self.gamma * (1 / nr_len) * weight
+                )
 
-        # Convert back to sparse vector
-        terms = list(self.index.get_terms())
-        terms.sort()
+        # Keep positive weights, sorted by term
         updated_query_vector = [
             (term, weight)
-            for (term, weight) in zip(terms, updated_query_vector)
+            for (term, weight) in sorted(updated_query_vector.items())
             if weight > 0
         ]
 
         return updated_query_vector
 
-    def _to_full_vector(self, query_vector: List[Tuple[str, float]]) -> np.array:
-        """Converts the sparse vector of (term, weights) into a full vector where the dimensions are the sorted terms
+    def _get_vectors_sum(self, feedback_key, relevant: bool, doc_ids: Set) -> Dict[str, float]:
+        """Returns sum of the sparse vectors of documents, updated from the cached sum of the feedback key if any
         
         Arguments:
-            query_vector {List[Tuple[str, float]]} -- Query in form (term, weights)
+            feedback_key {[type]} -- Key of the feedback sets, no caching if None
+            relevant {bool} -- Whether the documents are the relevant or non relevant ones
+            doc_ids {Set} -- Document ids
         
         Returns:
-            np.array -- Full query vector
+            Dict[str, float] -- Sum of the document vectors in form of {term: summed TF-IDF}
         """
-        terms = list(self.index.get_terms())
-        terms.sort()
-        vector = np.zeros(len(terms))
+        doc_ids = set(doc_ids)
+        cached_doc_ids, vectors_sum = self._feedback_sums.get(
+            (feedback_key, relevant), (set(), {})
+        )
+        if feedback_key is None:
+            cached_doc_ids, vectors_sum = set(), {}
+
+        # Start over when all documents change rather than subtracting them
+        if len(doc_ids & cached_doc_ids) == 0:
+            cached_doc_ids, vectors_sum = set(), {}
+
+        for doc_id in doc_ids - cached_doc_ids:
+            for term, tf_idf in self.index.get_docID_postings(doc_id).items():
+                vectors_sum[term] = vectors_sum.get(term, 0) + tf_idf
+        for doc_id in cached_doc_ids - doc_ids:
+            for term, tf_idf in self.index.get_docID_postings(doc_id).items():
+                # Terms with a TF-IDF of 0 (idf 0) may already be gone when another document having them was removed
+                vectors_sum[term] = vectors_sum.get(term, 0) - tf_idf
+                # TF-IDF weights are positive, what is left when no other document has the term is rounding error
+                if vectors_sum[term] < 1e-9:
+                    vectors_sum.pop(term)
 
-        for (term, weight) in query_vector:
-            index = terms.index(term)
-            vector[index] = weight
+        if feedback_key is not None:
+            self._feedback_sums[(feedback_key, relevant)] = (doc_ids, vectors_sum)
+            self._feedback_sums.move_to_end((feedback_key, relevant))
+            # Each key has up to two entries, relevant and non relevant sums
+            while len(self._feedback_sums) > 2 * self.max_feedback_keys:
+                self._feedback_sums.popitem(last=False)
 
-        return vector
+        return vectors_sum
@@ -0,0 +1,290 @@
+# Module 10 - Search Engine
+# Purpose: Load the models of every corpus once and expose the search engine capabilities without a user interface
+
+from bigram_language_model import BigramLanguageModel
+from boolean_retrieval import BooleanRetrievalModel
+from corpus_access import document_stores, get_topic_docIDs
+from document_similarity import DocumentSimilarityGraph
+from inverted_index import InvertedIndex
+from query_completion import QueryCompleter
+from query_expansion import SynonymTable, expand_query
+from snippets import SnippetIndex
+from spelling_correction import SpellingCorrector
+from term_association import TermAssociationIndex
+from topic_index import TopicIndex
+from vector_space_model import VectorSpaceModel
+
+import pandas as pd
+from pathlib import Path
+import pickle
+from typing import List, Tuple
+
+
+# Model files of each corpus relative to the models folder, optional models may be missing
+corpus_model_paths = {
+    "uo_courses": {
+        "index": "indexes/UofO_courses_index.pkl",
+        "bigram_model": "bigram_language_models/UofO_bigram_model.pkl",
+        "similarity_graph": "indexes/UofO_courses_similarity_graph.pkl",
+        "snippet_index": "indexes/UofO_courses_snippet_index.pkl",
+        "topic_index": None,
+        "synonym_table": "synonym_tables/UofO_synonym_table.pkl",
+        "term_associations": "term_associations/UofO_term_associations.pkl",
+    },
+    "reuters": {
+        "index": "indexes/reuters_index.pkl",
+        "bigram_model": "bigram_language_models/reuters_bigram_model.pkl",
+        "similarity_graph": "indexes/reuters_similarity_graph.pkl",
+        "snippet_index": "indexes/reuters_snippet_index.pkl",
+        "topic_index": "indexes/reuters_topic_index.pkl",
+        "synonym_table": "synonym_tables/reuters_synonym_table.pkl",
+        "term_associations": "term_associations/reuters_term_associations.pkl",
+    },
+}
+
+
+class SearchEngine:
+    """Models of every corpus loaded once, used by the user interface and the search service. Corpora are
+    'uo_courses' and 'reuters', models are 'vsm' and 'boolean'.
+    """
+
+    def __init__(self, corpora: List[str] = None, models_path: str = None):
+        """
+        Keyword Arguments:
+            corpora {List[str]} -- Corpora to load, all if None (default: {None})
+            models_path {str} -- Folder of the models, the models folder of the repo if None (default: {None})
+        """
+        models_path = (
+            Path(__file__).parent / "../models" if models_path is None else Path(models_path)
+        )
+        self.corpora = list(corpus_model_paths.keys()) if corpora is None else list(corpora)
+
+        self.indexes, self.vsm_models, self.bool_models = {}, {}, {}
+        self.query_completers, self.spelling_correctors = {}, {}
+        self.similarity_graphs, self.snippet_indexes, self.topic_indexes = {}, {}, {}
+        self.synonym_tables, self.term_associations = {}, {}
+
+        for corpus in self.corpora:
+            paths = corpus_model_paths[corpus]
+            index = _load(models_path, paths["index"], required=True)
+            bigram_model = _load(models_path, paths["bigram_model"], required=True)
+
+            self.indexes[corpus] = index
+            self.vsm_models[corpus] = VectorSpaceModel(index)
+            self.bool_models[corpus] = BooleanRetrievalModel(index)
+            self.query_completers[corpus] = QueryCompleter(bigram_model)
+            self.spelling_correctors[corpus] = SpellingCorrector(
+                index.dictionary.words_raw, bigram_language_model=bigram_model
+            )
+            self.similarity_graphs[corpus] = _load(models_path, paths["similarity_graph"])
+            self.snippet_indexes[corpus] = _load(models_path, paths["snippet_index"])
+            self.topic_indexes[corpus] = _load(models_path, paths["topic_index"])
+            self.synonym_tables[corpus] = _load(models_path, paths["synonym_table"])
+            self.term_associations[corpus] = _load(models_path, paths["term_associations"])
+        return
+
+    def preload(self) -> None:
+        """Opens the document stores of the corpora now instead of on first access, e.g. so that worker processes
+        forked afterwards share their memory maps
+        """
+        for corpus in self.corpora:
+            document_stores[corpus].get_documents([])
+        return
+
+    def search(
+        self,
+        corpus: str,
+        query,
+        model: str = "vsm",
+        topic: str = None,
+        limit: int = 10,
+        relevant_doc_ids: set = {},
+        non_relevant_doc_ids: set = {},
+        feedback_key=None,
+    ) -> dict:
+        """Retrieves the best documents for a query, topics are counted over all matching documents if the corpus has a
+        topic index
+
+        Arguments:
+            corpus {str} -- Corpus to search
+            query {[type]} -- Query string, or query vector in form of list of tuples (word, weight) for the vsm
+
+        Keyword Arguments:
+            model {str} -- Either 'vsm' or 'boolean' (default: {"vsm"})
+            topic {str} -- Topic to filter results, pushed down into retrieval (default: {None})
+            limit {int} -- Amount of documents to return (default: {10})
+            relevant_doc_ids {set} -- Documents judged relevant to the query, vsm only (default: {{}})
+            non_relevant_doc_ids {set} -- Documents judged non relevant to the query, vsm only (default: {{}})
+            feedback_key {[type]} -- Key of the relevance feedback sets, see VectorSpaceModel.vector_search (default: {None})
+
+        Returns:
+            dict -- docIDs and scores of the results, estimated_count of results for the boolean model and
+                facet_counts as a list of (topic, count), None when not available
+        """
+        topic_index = self.topic_indexes[corpus]
+        candidate_doc_ids = get_topic_docIDs(corpus, topic, topic_index)
+
+        estimated_count = None
+        facet_counts = None
+        if model == "vsm":
+            vsm_model = self.vsm_models[corpus]
+            query_vector = vsm_model.to_vector(query) if isinstance(query, str) else list(query)
+            results = vsm_model.vector_search(
+                query_vector,
+                include_similarities=True,
+                limit=limit if topic_index is None else -1,
+                relevant_doc_ids=relevant_doc_ids,
+                non_relevant_doc_ids=non_relevant_doc_ids,
+                candidate_doc_ids=candidate_doc_ids,
+                feedback_key=feedback_key,
+            )
+            if topic_index is not None:
+                facet_counts = topic_index.facet_counts([docID for docID, _ in results], limit=5)
+                results = results[:limit]
+            docIDs = [docID for docID, _ in results]
+            scores = [score for _, score in results]
+        elif model == "boolean":
+            # Only evaluate the first page of results, the total is estimated from postings lengths
+            bool_model = self.bool_models[corpus]
+            docIDs, _ = bool_model.retrieve_page(
+                query, page_size=limit, candidate_doc_ids=candidate_doc_ids
+            )
+            estimated_count = bool_model.estimate_cardinality(query)
+            if topic_index is not None:
+                facet_counts = topic_index.facet_counts(
+                    bool_model.iter_results(query, candidate_doc_ids=candidate_doc_ids), limit=5
+                )
+            scores = [1] * len(docIDs)
+        else:
+            raise ValueError(f"Unknown model {model}, options are 'vsm' or 'boolean'")
+
+        return {
+            "docIDs": docIDs,
+            "scores": scores,
+            "estimated_count": estimated_count,
+            "facet_counts": facet_counts,
+        }
+
+    def get_documents(self, corpus: str, docIDs: list, query_str: str = None) -> pd.DataFrame:
+        """Returns the documents to show for search results, with an excerpt biased towards the query if given
+
+        Arguments:
+            corpus {str} -- Corpus of the documents
+            docIDs {list} -- Document ids
+
+        Keyword Arguments:
+            query_str {str} -- Query of the search results (default: {None})
+
+        Returns:
+            pd.DataFrame -- Title, body and excerpt of the documents indexed by docID
+        """
+        documents = document_stores[corpus].get_documents(docIDs, columns=["title", "body"])
+
+        snippet_index = self.snippet_indexes[corpus]
+        query_terms = (
+            self.indexes[corpus].dictionary.preprocess_document(query_str) if query_str else []
+        )
+        excerpts = []
+        for (docID, body) in zip(documents.index, documents["body"]):
+            if snippet_index is not None and query_terms:
+                excerpts.append(snippet_index.get_snippet(docID, body, query_terms))
+            else:
+                excerpts.append(body[:150] if len(body) > 150 else body)
+        documents["excerpt"] = excerpts
+        return documents
+
+    def suggest(self, corpus: str, query_str: str, limit: int = 5) -> List[str]:
+        """Returns spelling corrected queries
+
+        Arguments:
+            corpus {str} -- Corpus of the vocabulary
+            query_str {str} -- Query string
+
+        Keyword Arguments:
+            limit {int} -- Amount of suggestions (default: {5})
+
+        Returns:
+            List[str] -- Suggested queries
+        """
+        return self.spelling_correctors[corpus].check_query(query_str, limit=limit)
+
+    def complete(self, corpus: str, query_str: str) -> List[str]:
+        """Returns completions of a query from the bigram language model of the corpus
+
+        Arguments:
+            corpus {str} -- Corpus of the language model
+            query_str {str} -- Query string
+
+        Returns:
+            List[str] -- Completed queries
+        """
+        return self.query_completers[corpus].complete_query(query_str)
+
+    def expand(self, corpus: str, query_str: str, model: str = "vsm", expansion: str = "wordnet"):
+        """Expands a query with WordNet synonyms or collection term associations
+
+        Arguments:
+            corpus {str} -- Corpus of the expansion models
+            query_str {str} -- Query string
+
+        Keyword Arguments:
+            model {str} -- Either 'vsm' or 'boolean' (default: {"vsm"})
+            expansion {str} -- Either 'wordnet' or 'corpus' (default: {"wordnet"})
+
+        Returns:
+            [type] -- Expanded query vector for the vsm, expanded query string for the boolean model
+        """
+        term_associations = self.term_associations[corpus] if expansion == "corpus" else None
+        return expand_query(query_str, model, self.synonym_tables[corpus], term_associations)
+
+    def more_like_this(self, corpus: str, docID, k: int = None) -> List[Tuple[str, float]]:
+        """Returns the documents most similar to a document from the precomputed similarity graph
+
+        Arguments:
+            corpus {str} -- Corpus of the document
+            docID {[type]} -- Document id
+
+        Keyword Arguments:
+            k {int} -- Amount of documents (default: {None})
+
+        Returns:
+            List[Tuple[str, float]] -- List of (docID, cosine similarity), empty if the corpus has no similarity graph
+        """
+        similarity_graph = self.similarity_graphs[corpus]
+        if similarity_graph is None:
+            return []
+        return similarity_graph.get_similar(docID, k)
+
+    def parse_docID(self, corpus: str, docID: str):
+        """Converts a docID given as text, e.g. from the user interface, to the docID of the corpus
+
+        Arguments:
+            corpus {str} -- Corpus of the document
+            docID {str} -- Document id as text
+
+        Returns:
+            [type] -- Document id, int for reuters
+        """
+        docID = docID.strip()
+        return int(docID) if corpus == "reuters" else docID
+
+
+def _load(models_path: Path, path: str, required: bool = False):
+    """Loads a pickled model
+
+    Arguments:
+        models_path {Path} -- Folder of the models
+        path {str} -- Path of the model relative to the models folder, None if the corpus has no such model
+
+    Keyword Arguments:
+        required {bool} -- Raise an error if the model is missing instead of returning None (default: {False})
+
+    Returns:
+        [type] -- Model, None if it is missing and not required
+    """
+    if path is None:
+        return None
+    path = models_path / path
+    if not path.exists() and not required:
+        return None
+    return pickle.load(path.open("rb"))
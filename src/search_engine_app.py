@@ -25,23 +25,13 @@ from kivy.uix.widget import Widget
 from collections import defaultdict
 from functools import partial
 import pandas as pd
-import pickle
 import re
 import textwrap
 from win32api import GetSystemMetrics
 
 # Search engine modules
-from bigram_language_model import BigramLanguageModel
-from boolean_retrieval import BooleanRetrievalModel
-from corpus_access import contains_topic, corpora, get_corpus_texts, reuters_topics
-from inverted_index import InvertedIndex
-from query_completion import QueryCompleter
-from query_expansion import expand_query
-from spelling_correction import SpellingCorrector
-from vector_space_model import VectorSpaceModel
-
-# Other
-from pathlib import Path
+from corpus_access import reuters_topics
+from search_engine import SearchEngine
 
 
 # Relevance feedback stored as a dictionary in form of {'query': (list of non relevant docIDs, list of relevant docIDs)} per corpus
@@ -63,44 +53,13 @@ class ScrollableLabel(ScrollView):
 class SearchScreen(GridLayout):
 
     # Load index and setup models
-    uo_index_path = Path(__file__).parent / "../models/indexes/UofO_Courses_index.pkl"
-    uo_index = pickle.load(uo_index_path.open("rb"))
-    uo_spelling_corrector = SpellingCorrector(uo_index.dictionary.words_raw)
-    uo_vsm_model = VectorSpaceModel(uo_index)
-    uo_bool_model = BooleanRetrievalModel(uo_index)
-    uo_bigram_path = (
-        Path(__file__).parent / "../models/bigram_language_models/UofO_bigram_model.pkl"
-    )
-    uo_bigram_model = pickle.load(uo_bigram_path.open("rb"))
-    uo_query_completer = QueryCompleter(uo_bigram_model)
-
-    reuters_index_path = Path(__file__).parent / "../models/indexes/reuters_index.pkl"
-    reuters_index = pickle.load(reuters_index_path.open("rb"))
-    reuters_spelling_corrector = SpellingCorrector(reuters_index.dictionary.words_raw)
-    reuters_vsm_model = VectorSpaceModel(reuters_index)
-    reuters_bool_model = BooleanRetrievalModel(reuters_index)
-    reuters_bigram_path = (
-        Path(__file__).parent
-        / "../models/bigram_language_models/reuters_bigram_model.pkl"
-    )
-    reuters_bigram_model = pickle.load(reuters_bigram_path.open("rb"))
-    reuters_query_completer = QueryCompleter(reuters_bigram_model)
-
-    indexes = {"uo_courses": uo_index, "reuters": reuters_index}
-    spelling_correctors = {
-        "uo_courses": uo_spelling_corrector,
-        "reuters": reuters_spelling_corrector,
-    }
-    vsm_models = {"uo_courses": uo_vsm_model, "reuters": reuters_vsm_model}
-    bool_models = {"uo_courses": uo_bool_model, "reuters": reuters_bool_model}
-    query_completers = {
-        "uo_courses": uo_query_completer,
-        "reuters": reuters_query_completer,
-    }
+    engine = SearchEngine()
 
     # Flags for options when searching
     model_selected = "vsm"
     corpus_selected = "uo_courses"
+    expansion_selected = "wordnet"
+    search_results = pd.DataFrame(columns=["title", "body", "excerpt"])
 
 
     # https://stackoverflow.com/questions/26686631/how-do-you-scroll-a-gridlayout-inside-kivy-scrollview
@@ -127,8 +86,10 @@ class SearchScreen(GridLayout):
 
         # Get expanded query
         query_str = self.ids['search_query_input'].text
-        query_expanded = expand_query(query_str, self.model_selected)
-        query = self.vsm_models[self.corpus_selected].to_vector(query_str) if self.model_selected == 'vsm' else query_str
+        query_expanded = self.engine.expand(
+            self.corpus_selected, query_str, self.model_selected, self.expansion_selected
+        )
+        query = query_str
 
         # Buttons for options
         yes_btn = Button(text='Expanded', on_press = partial(self.search, query_expanded, query_str))
@@ -156,42 +117,37 @@ class SearchScreen(GridLayout):
             "uo_courses" if self.ids["uo_courses"].active else "reuters"
         )
 
+        # Topic filter is pushed down into retrieval so no results are lost after limiting
+        topic = self.ids['btn_dropdown'].text
+        topic = None if topic == 'Select topic' else topic
+
         # Get search results
         if self.ids["vsm"].active:
-            relevant_doc_ids = relevance_feedback[self.corpus_selected][query_str][1]
-            non_relevant_doc_ids = relevance_feedback[self.corpus_selected][query_str][0]
-            results = self.vsm_models[self.corpus_selected].vector_search(
+            results = self.engine.search(
+                self.corpus_selected,
                 query,
-                include_similarities=True,
-                limit=10,
-                relevant_doc_ids=relevant_doc_ids,
-                non_relevant_doc_ids=non_relevant_doc_ids,
+                model="vsm",
+                topic=topic,
+                relevant_doc_ids=relevance_feedback[self.corpus_selected][query_str][1],
+                non_relevant_doc_ids=relevance_feedback[self.corpus_selected][query_str][0],
+                feedback_key=query_str,
             )
-            docIDs = [docID for docID, _ in results]
-            scores = [score for _, score in results]
         elif self.ids["boolean"].active:
-            docIDs = self.bool_models[self.corpus_selected].retrieve_results(query)
-            scores = [1] * len(docIDs)
+            results = self.engine.search(self.corpus_selected, query, model="boolean", topic=topic)
         else:
             return
 
         # Get suggested queries
-        suggested_queries = self.spelling_correctors[self.corpus_selected].check_query(
-            query_str, limit=5
-        )
+        suggested_queries = self.engine.suggest(self.corpus_selected, query_str, limit=5)
 
         # Update search results
-        topic = self.ids['btn_dropdown'].text
-
-        search_results = corpora[self.corpus_selected].loc[docIDs]
-        search_results["score"] = scores
-
-        # Get subset of texts of given topic
-        if topic != 'Select topic' and self.corpus_selected == "reuters":
-            topic_filter = contains_topic(search_results["topics"], topic)
-            search_results = search_results.loc[topic_filter]
-        
-        self.show_search_results(search_results)
+        search_results = self.engine.get_documents(
+            self.corpus_selected, results["docIDs"], query_str
+        )
+        search_results["score"] = results["scores"]
+        self.show_search_results(
+            search_results, results["estimated_count"], results["facet_counts"]
+        )
 
         # Update suggested queries
         self.show_suggested_queries(suggested_queries)
@@ -201,17 +157,32 @@ class SearchScreen(GridLayout):
 
         return
 
-    def show_search_results(self, search_results: pd.DataFrame) -> None:
+    def show_search_results(
+        self,
+        search_results: pd.DataFrame,
+        estimated_count: int = None,
+        facet_counts: list = None,
+    ) -> None:
         """
         Displays search results in the search result grid
+        If an estimated count is given, it is shown as "about N results" in the title
+        If facet counts are given as a list of (topic, count), they are shown under the title
         """
+        # Documents shown are kept for the popup
+        self.search_results = search_results
+
         search_results_grid = self.ids["search_results_grid"]
 
         # Clear previous search results
         search_results_grid.clear_widgets()
 
         # Add table titles
-        title = Label(text="Search Results")
+        title_text = "Search Results"
+        if estimated_count is not None:
+            title_text += f" (about {estimated_count} results)"
+        if facet_counts:
+            title_text += "\n" + ", ".join(f"{topic} ({count})" for (topic, count) in facet_counts)
+        title = Label(text=title_text)
         score = Label(text="Score")
         relevance = Label(text="Relevance", size_hint_x=None)
         search_results_grid.add_widget(title)
@@ -222,9 +193,7 @@ class SearchScreen(GridLayout):
             # Add course info
             title = doc["title"]
             title = title[:50] if len(title) > 50 else title
-            body = doc["body"]
-            excerpt = body[:150] if len(body) > 150 else body
-            excerpt = textwrap.fill(excerpt, 75)
+            excerpt = textwrap.fill(doc["excerpt"], 75)
             search_result = LabelButton(text=f"{docID} - {title}\n{excerpt}", size_hint=(1, None))
             search_result.bind(on_press=self.show_search_result_popup)
             search_results_grid.add_widget(search_result)
@@ -276,11 +245,12 @@ class SearchScreen(GridLayout):
         Open a popup for clicked on search result to show entire search result body
         """
 
-        docID = instance.text.split("-")[0].strip()
-        if self.corpus_selected == "reuters":
-            docID = int(docID)
+        docID = self.engine.parse_docID(self.corpus_selected, instance.text.split("-")[0])
 
-        doc = get_corpus_texts(self.corpus_selected, [docID]).iloc[0]
+        if docID in self.search_results.index:
+            doc = self.search_results.loc[docID]
+        else:
+            doc = self.engine.get_documents(self.corpus_selected, [docID]).iloc[0]
         title = doc["title"]
         body = doc["body"]
 
@@ -304,11 +274,39 @@ class SearchScreen(GridLayout):
         #     size_hint=(None, None),
         #     size=(600, 600)
         # )
-        search_result_popup.add_widget(label)
+        box_layout = BoxLayout(orientation="vertical")
+        box_layout.add_widget(label)
+        if self.engine.similarity_graphs[self.corpus_selected] is not None:
+            more_btn = Button(
+                text="More like this",
+                size_hint_y=None,
+                height=44,
+                on_press=partial(self.more_like_this, docID, search_result_popup),
+            )
+            box_layout.add_widget(more_btn)
+        search_result_popup.add_widget(box_layout)
         search_result_popup.open()
 
         return
 
+    def more_like_this(self, docID, popup: Popup, instance) -> None:
+        """Shows the documents most similar to the given document from the precomputed similarity graph
+        
+        Arguments:
+            docID {[type]} -- docID
+            popup {Popup} -- Popup of the document to close
+            instance {[type]} -- Button instance
+        """
+        popup.dismiss()
+        results = self.engine.more_like_this(self.corpus_selected, docID)
+        docIDs = [docID for docID, _ in results]
+        scores = [score for _, score in results]
+
+        search_results = self.engine.get_documents(self.corpus_selected, docIDs)
+        search_results["score"] = scores
+        self.show_search_results(search_results)
+        return
+
     def show_suggested_queries(self, suggested_queries: list) -> None:
         """
         Displays suggested queries in suggested queries grid
@@ -346,9 +344,7 @@ class SearchScreen(GridLayout):
         query_completions_grid = self.ids["query_completions_grid"]
 
         # Get completed queries given corpus
-        completed_queries = self.query_completers[self.corpus_selected].complete_query(
-            query
-        )
+        completed_queries = self.engine.complete(self.corpus_selected, query)
 
         # Clear previous completed queries
         query_completions_grid.clear_widgets()
@@ -377,6 +373,12 @@ class SearchScreen(GridLayout):
         self.model_selected = "vsm" if self.ids["vsm"].active else "boolean"
         return
 
+    def toggle_expansion(self) -> None:
+        """Toggles query expansion between WordNet synonyms and collection term associations
+        """
+        self.expansion_selected = "wordnet" if self.ids["wordnet"].active else "corpus"
+        return
+
     def toggle_corpus(self) -> None:
         """Toggles selected corpus
         """
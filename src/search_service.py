@@ -0,0 +1,354 @@
+# Module 11 - Search Service
+# Purpose: Serve the search engine as a HTTP/JSON API so that other front ends can use it
+
+# Endpoints, all GET with parameters in the query string, corpus is 'uo_courses' or 'reuters':
+#   /search?corpus=&q=&model=vsm|boolean&topic=&limit=10&expansion=wordnet|corpus&relevant=&non_relevant=
+#   /suggest?corpus=&q=&limit=5
+#   /complete?corpus=&q=
+#   /expand?corpus=&q=&model=vsm|boolean&expansion=wordnet|corpus
+#   /similar?corpus=&docID=&k=10
+#   /document?corpus=&docID=
+# Responses are JSON objects with the time spent in the worker (compute_ms) and in the service (latency_ms)
+
+from search_engine import SearchEngine
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import gc
+import json
+import multiprocessing
+import time
+from urllib.parse import parse_qs, urlsplit
+
+
+# Search engine of a worker process, loaded once by _init_worker
+_engine = None
+
+_status_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+class NotFoundError(Exception):
+    """Unknown endpoint or document, answered with status 404
+    """
+
+    pass
+
+
+def _init_worker(corpora: list) -> None:
+    """Loads the models of the search engine in a worker process
+
+    Arguments:
+        corpora {list} -- Corpora to load, all if None
+    """
+    global _engine
+    _engine = SearchEngine(corpora)
+    return
+
+
+def _worker_ready() -> None:
+    # No-op run once per worker to start the pool
+    return
+
+
+def create_executor(
+    n_workers: int, corpora: list = None, engine: SearchEngine = None
+) -> ProcessPoolExecutor:
+    """Creates the pool of worker processes running the requests. Without an engine every worker loads its own models.
+    With an engine (pre-fork mode), the models loaded once in this process are inherited by forked workers which
+    share their memory pages read-only until written, only available where processes can be forked (not Windows)
+
+    Arguments:
+        n_workers {int} -- Amount of worker processes
+
+    Keyword Arguments:
+        corpora {list} -- Corpora loaded by each worker, all if None, unused in pre-fork mode (default: {None})
+        engine {SearchEngine} -- Search engine loaded in this process for pre-fork mode (default: {None})
+
+    Returns:
+        ProcessPoolExecutor -- Pool of workers running _worker_handle_request, already started so that workers don't
+            inherit sockets opened afterwards, e.g. the listening socket of the service
+    """
+    if engine is None:
+        executor = ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_worker, initargs=(corpora,)
+        )
+        return _start_workers(executor, n_workers)
+
+    global _engine
+    _engine = engine
+    _engine.preload()
+
+    # Objects allocated so far are moved out of the garbage collector so that collections in the workers don't
+    # write to, and copy, the shared pages
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+    executor = ProcessPoolExecutor(
+        max_workers=n_workers, mp_context=multiprocessing.get_context("fork")
+    )
+    return _start_workers(executor, n_workers)
+
+
+def _start_workers(executor: ProcessPoolExecutor, n_workers: int) -> ProcessPoolExecutor:
+    """Starts every worker of a pool now instead of on the first requests, and waits until they are ready (models
+    loaded by the initializer)
+
+    Arguments:
+        executor {ProcessPoolExecutor} -- Pool of workers
+        n_workers {int} -- Amount of workers of the pool
+
+    Returns:
+        ProcessPoolExecutor -- Same pool
+    """
+    # Tasks are all submitted before any can finish so that no worker is reused instead of being started
+    futures = [executor.submit(_worker_ready) for _ in range(n_workers)]
+    for future in futures:
+        future.result()
+    return executor
+
+
+def handle_request(engine: SearchEngine, endpoint: str, params: dict) -> dict:
+    """Runs a request against the search engine
+
+    Arguments:
+        engine {SearchEngine} -- Search engine
+        endpoint {str} -- Path of the request, e.g. '/search'
+        params {dict} -- Parameters of the request, one string per name
+
+    Raises:
+        KeyError: Missing parameter or unknown corpus
+        ValueError: Invalid parameter value
+        NotFoundError: Unknown endpoint or document
+
+    Returns:
+        dict -- JSON serializable response
+    """
+    if endpoint == "/search":
+        corpus, query_str = params["corpus"], params["q"]
+        model = params.get("model", "vsm")
+        expansion = params.get("expansion")
+        query = engine.expand(corpus, query_str, model, expansion) if expansion else query_str
+        relevant = {engine.parse_docID(corpus, docID) for docID in _split(params.get("relevant"))}
+        non_relevant = {
+            engine.parse_docID(corpus, docID) for docID in _split(params.get("non_relevant"))
+        }
+
+        results = engine.search(
+            corpus,
+            query,
+            model=model,
+            topic=params.get("topic"),
+            limit=int(params.get("limit", 10)),
+            relevant_doc_ids=relevant,
+            non_relevant_doc_ids=non_relevant,
+            feedback_key=query_str,
+        )
+        documents = engine.get_documents(corpus, results["docIDs"], query_str)
+        return {
+            "query": query,
+            "results": [
+                {"docID": docID, "score": score, "title": title, "excerpt": excerpt}
+                for (docID, score, title, excerpt) in zip(
+                    documents.index, results["scores"], documents["title"], documents["excerpt"]
+                )
+            ],
+            "estimated_count": results["estimated_count"],
+            "facet_counts": results["facet_counts"],
+        }
+
+    if endpoint == "/suggest":
+        limit = int(params.get("limit", 5))
+        return {"suggestions": engine.suggest(params["corpus"], params["q"], limit=limit)}
+
+    if endpoint == "/complete":
+        return {"completions": engine.complete(params["corpus"], params["q"])}
+
+    if endpoint == "/expand":
+        query = engine.expand(
+            params["corpus"],
+            params["q"],
+            params.get("model", "vsm"),
+            params.get("expansion", "wordnet"),
+        )
+        return {"query": query}
+
+    if endpoint == "/similar":
+        corpus = params["corpus"]
+        docID = engine.parse_docID(corpus, params["docID"])
+        k = int(params["k"]) if "k" in params else None
+        return {
+            "results": [
+                {"docID": docID, "score": score}
+                for (docID, score) in engine.more_like_this(corpus, docID, k)
+            ]
+        }
+
+    if endpoint == "/document":
+        corpus = params["corpus"]
+        documents = engine.get_documents(corpus, [engine.parse_docID(corpus, params["docID"])])
+        if len(documents) == 0:
+            raise NotFoundError(f"Unknown docID {params['docID']}")
+        return {
+            "docID": documents.index[0],
+            "title": documents["title"].iloc[0],
+            "body": documents["body"].iloc[0],
+        }
+
+    raise NotFoundError(f"Unknown endpoint {endpoint}")
+
+
+def _worker_handle_request(endpoint: str, params: dict) -> tuple:
+    """Runs a request in a worker process with its search engine
+
+    Arguments:
+        endpoint {str} -- Path of the request
+        params {dict} -- Parameters of the request
+
+    Returns:
+        tuple -- HTTP status and JSON serializable response
+    """
+    start = time.perf_counter()
+    try:
+        status, response = 200, handle_request(_engine, endpoint, params)
+    except KeyError as error:
+        status, response = 400, {"error": f"Missing parameter or unknown value {error}"}
+    except NotFoundError as error:
+        status, response = 404, {"error": str(error)}
+    except ValueError as error:
+        status, response = 400, {"error": str(error)}
+    except Exception as error:
+        status, response = 500, {"error": repr(error)}
+
+    response["compute_ms"] = (time.perf_counter() - start) * 1000
+    return status, response
+
+
+def _split(value: str) -> list:
+    # Comma separated parameter values
+    return [item for item in value.split(",") if item.strip()] if value else []
+
+
+def _to_json(value):
+    # numpy scalars and other values json doesn't know
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class SearchService:
+    """HTTP/JSON server running on asyncio, requests are parsed on the event loop and dispatched to a pool of worker
+    processes holding a search engine (see create_executor), so that CPU bound scoring of concurrent requests runs on
+    several cores.
+    Connections are kept alive between requests unless the client asks to close them.
+    """
+
+    def __init__(self, executor, host: str = "127.0.0.1", port: int = 8080, verbose: bool = True):
+        """
+        Arguments:
+            executor {[type]} -- Pool of workers running _worker_handle_request
+
+        Keyword Arguments:
+            host {str} -- Host to listen on (default: {"127.0.0.1"})
+            port {int} -- Port to listen on (default: {8080})
+            verbose {bool} -- Print a line with the latency of every request (default: {True})
+        """
+        self.executor = executor
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        return
+
+    async def serve(self) -> None:
+        """Serves requests until cancelled
+        """
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"Serving on http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader, writer) -> None:
+        """Answers the requests of a connection one after the other
+
+        Arguments:
+            reader {asyncio.StreamReader} -- Stream of the requests
+            writer {asyncio.StreamWriter} -- Stream of the responses
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+
+                # Headers are read up to the empty line, request bodies are not supported
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3 or parts[0] != "GET":
+                    status, response = 400, {"error": "Only GET requests are supported"}
+                else:
+                    url = urlsplit(parts[1])
+                    params = {name: values[-1] for (name, values) in parse_qs(url.query).items()}
+                    status, response = await loop.run_in_executor(
+                        self.executor, _worker_handle_request, url.path, params
+                    )
+
+                latency = (time.perf_counter() - start) * 1000
+                response["latency_ms"] = latency
+                body = json.dumps(response, default=_to_json).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {_status_reasons[status]}\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        f"X-Response-Time: {latency:.3f}ms\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    ).encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+
+                if self.verbose:
+                    print(f"{parts[1] if len(parts) > 1 else ''} {status} {latency:.1f}ms")
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+        return
+
+
+if __name__ == "__main__":
+
+    # Parse cmd arguments
+    parser = argparse.ArgumentParser(description="Serve the search engine as a HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--corpora", nargs="+", choices=["uo_courses", "reuters"], default=None)
+    parser.add_argument("--prefork", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    # Every worker loads the models once before serving, or in pre-fork mode the models are loaded once here and shared
+    if args.prefork:
+        print("Loading models")
+        executor = create_executor(args.workers, engine=SearchEngine(args.corpora))
+    else:
+        executor = create_executor(args.workers, args.corpora)
+    service = SearchService(executor, args.host, args.port, verbose=not args.quiet)
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
@@ -0,0 +1,218 @@
+# Module 8c - Sharded Search
+# Purpose: Search a collection partitioned into several inverted indexes, each searched by its own worker process
+
+import heapq
+import itertools
+import multiprocessing
+import numpy as np
+import pickle
+from pathlib import Path
+from sentence_preprocessing import tokenize
+from sparse_matrix import TermDocumentMatrix, csr_inner_products, top_k_rows
+from typing import Dict, List, Tuple
+from vector_space_model import preprocess_query_vector
+
+
+def get_shard_paths(folder: str, collection: str) -> List[Path]:
+    """Returns the paths of the index shards of a collection written by make_data, in order of the shards
+
+    Arguments:
+        folder {str} -- Folder of the shards
+        collection {str} -- Prefix of the shard files, e.g. 'reuters'
+
+    Returns:
+        List[Path] -- Paths of the shards
+    """
+    paths = Path(folder).glob(f"{collection}_index_shard_*.pkl")
+    return sorted(paths, key=lambda path: int(path.stem.rsplit("_", 1)[1]))
+
+
+class _Shard:
+    """Index of one shard as CSR arrays of log term frequencies, weighted by the global idf sent by the coordinator
+    """
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as index_file:
+            self.index = pickle.load(index_file)
+        self.matrix = TermDocumentMatrix(self.index)
+
+        postings = (self.index.index[term] for term in self.matrix.terms)
+        self.log_tfs = np.log10(
+            1
+            + np.fromiter(
+                (weight["freq"] for docs in postings for weight in docs.values()),
+                dtype=np.float64,
+                count=self.matrix.indptr[-1],
+            )
+        )
+        return
+
+    def get_document_freqs(self) -> Tuple[Dict[str, int], int]:
+        # Document frequencies of the terms of the shard and amount of documents
+        return dict(zip(self.matrix.terms, self.matrix.document_freqs.tolist())), len(self.matrix.docIDs)
+
+    def set_idfs(self, idfs: Dict[str, float]) -> None:
+        # TF-IDF weights and document lengths with the global idf
+        term_idfs = np.array([idfs[term] for term in self.matrix.terms])
+        self.tf_idfs = self.log_tfs * np.repeat(term_idfs, self.matrix.document_freqs)
+        self.lengths = np.sqrt(
+            np.bincount(
+                self.matrix.posting_doc_rows,
+                weights=np.square(self.tf_idfs),
+                minlength=len(self.matrix.docIDs),
+            )
+        )
+        self.lengths[self.lengths == 0] = 1
+        return
+
+    def search(self, query, similarity: str, limit: int) -> List[Tuple[str, float]]:
+        # Query string or vector preprocessed like VectorSpaceModel.vector_search, stopwords are dropped
+        query_vector = [(token, 1) for token in tokenize(query)] if isinstance(query, str) else query
+        query_vector = preprocess_query_vector(self.index.dictionary, query_vector)
+        term_ids, weights = [], []
+        for (word, weight) in query_vector:
+            if word in self.matrix.term_ids:
+                term_ids.append(self.matrix.term_ids[word])
+                weights.append(weight)
+        if len(term_ids) == 0:
+            return []
+
+        scores = csr_inner_products(
+            self.matrix.indptr,
+            self.matrix.posting_doc_rows,
+            self.tf_idfs,
+            len(self.matrix.docIDs),
+            np.array([0, len(term_ids)]),
+            np.array(term_ids, dtype=np.int64),
+            np.array(weights, dtype=np.float64),
+        )[0]
+        if similarity == "cosine":
+            scores /= np.sqrt(len(query_vector)) * self.lengths
+
+        # Limit of -1 keeps all documents with a positive score
+        rows = top_k_rows(scores[None, :], len(scores) if limit == -1 else limit)[0]
+        return [(self.matrix.docIDs[row], float(scores[row])) for row in rows]
+
+
+def _shard_worker(index_path: str, connection) -> None:
+    """Loop of a shard worker process: loads its shard, sends its document frequencies, receives the global idf, then
+    answers (query, similarity, limit) requests until it receives None
+
+    Arguments:
+        index_path {str} -- Path of the pickled index of the shard
+        connection {[type]} -- Pipe connection to the coordinator
+    """
+    shard = _Shard(index_path)
+    connection.send(shard.get_document_freqs())
+    shard.set_idfs(connection.recv())
+
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        try:
+            connection.send(("ok", shard.search(*request)))
+        except Exception as error:
+            connection.send(("error", repr(error)))
+
+    connection.close()
+    return
+
+
+class ShardedSearch:
+    """Coordinator of a collection partitioned by documents into index shards. Every shard is searched by a local
+    worker process, the query is broadcast to all workers and their top results are merged into the final ranking.
+
+    Document frequencies of all shards are aggregated once at startup, so that every shard weighs terms with the idf of
+    the whole collection and scores are the same as with a single index of the collection.
+    """
+
+    def __init__(self, shard_paths: List[str]):
+        """
+        Arguments:
+            shard_paths {List[str]} -- Paths of the pickled index of each shard, see get_shard_paths
+        """
+        self._connections, self._processes = [], []
+        for shard_path in shard_paths:
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker, args=(str(shard_path), worker_connection), daemon=True
+            )
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+        # Global document frequencies, shards are loaded in parallel
+        document_freqs, self.n_docs = {}, 0
+        for connection in self._connections:
+            shard_document_freqs, shard_n_docs = connection.recv()
+            self.n_docs += shard_n_docs
+            for (term, document_freq) in shard_document_freqs.items():
+                document_freqs[term] = document_freqs.get(term, 0) + document_freq
+
+        self.idfs = {
+            term: np.log10(self.n_docs / document_freq)
+            for (term, document_freq) in document_freqs.items()
+            if document_freq > 0
+        }
+        for connection in self._connections:
+            connection.send(self.idfs)
+        return
+
+    def search(
+        self,
+        query,
+        similarity: str = "inner-product",
+        limit: int = 10,
+        include_similarities: bool = False,
+    ) -> list:
+        """Searches all shards and merges their results, like VectorSpaceModel.search on the whole collection. Queries
+        are preprocessed with the same preprocess_query_vector, so results and scores are the same
+
+        Arguments:
+            query {[type]} -- Query string, or query vector in form of list of tuples (word, weight)
+
+        Keyword Arguments:
+            similarity {str} -- Either "inner-product" or "cosine" (default: {"inner-product"})
+            limit {int} -- Amount of documents to return, all if -1 (default: {10})
+            include_similarities {bool} -- Return tuples (docID, similarity) instead of docIDs (default: {False})
+
+        Raises:
+            RuntimeError: A shard failed to answer the query
+
+        Returns:
+            list -- Best docIDs by decreasing similarity, documents with 0 similarity are excluded
+        """
+        if similarity not in ["inner-product", "cosine"]:
+            raise ValueError(f"Unknown similarity {similarity}, options are 'inner-product' or 'cosine'")
+
+        # Scatter the query to every shard, they search concurrently
+        for connection in self._connections:
+            connection.send((query, similarity, limit))
+
+        # Gather the top results of every shard, each sorted by decreasing similarity. Every reply is received before
+        # raising so that none is left in the pipes for the next query
+        replies = [connection.recv() for connection in self._connections]
+        errors = [results for (status, results) in replies if status != "ok"]
+        if len(errors) > 0:
+            raise RuntimeError(f"Shard search failed: {errors[0]}")
+        shard_results = [results for (_, results) in replies]
+
+        results = list(
+            itertools.islice(
+                heapq.merge(*shard_results, key=lambda result: -result[1]),
+                None if limit == -1 else limit,
+            )
+        )
+        if not include_similarities:
+            results = [docID for (docID, _) in results]
+        return results
+
+    def close(self) -> None:
+        """Stops the shard workers
+        """
+        for connection in self._connections:
+            connection.send(None)
+        for process in self._processes:
+            process.join()
+        return
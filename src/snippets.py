@@ -0,0 +1,148 @@
+# Module 5d - Snippet Generation
+# Purpose: Show for each search result the sentences of the document which best match the query
+
+import numpy as np
+import re
+from inverted_index import InvertedIndex
+from typing import List
+
+# A sentence ends at punctuation followed by a capitalized word, or at the end of the document
+_SENTENCE_PATTERN = re.compile(r"\S.*?(?:[.!?](?=\s+[A-Z0-9\"'(])|$)", re.S)
+
+
+class SnippetIndex:
+    """Sentence boundaries and terms of every sentence of the documents of an index, computed at build time so that
+    query biased snippets are chosen without tokenizing documents at query time.
+
+    Stored as CSR arrays: sentences of document row i are _doc_indptr[i] to _doc_indptr[i + 1], sentence j spans the
+    characters _sentence_starts[j]:_sentence_ends[j] of the body and contains the distinct term ids
+    _sentence_term_ids[_sentence_indptr[j]:_sentence_indptr[j + 1]].
+
+    Attributes:
+        terms {List[str]} -- Index terms sorted alphabetically, the id of a term is its position
+        idfs {np.ndarray} -- Inverse document frequency of each term id
+    """
+
+    def __init__(self, index: InvertedIndex, corpus: List[str], docIDs: list):
+        """
+        Arguments:
+            index {InvertedIndex} -- Index of the collection, gives the preprocessing and the idf of terms
+            corpus {List[str]} -- Document bodies, as shown to the user
+            docIDs {list} -- DocIDs of the bodies
+        """
+        self.terms = sorted(index.index.keys())
+        self.term_ids = {term: i for (i, term) in enumerate(self.terms)}
+        self.idfs = np.array(
+            [np.log10(len(index.docIDs) / len(index.index[term])) for term in self.terms]
+        )
+        self.doc_rows = {docID: i for (i, docID) in enumerate(docIDs)}
+
+        doc_n_sentences, starts, ends, sentence_n_terms, term_ids = [], [], [], [], []
+        for body in corpus:
+            body = "" if not isinstance(body, str) else body
+            sentences = list(_SENTENCE_PATTERN.finditer(body))
+            doc_n_sentences.append(len(sentences))
+            for sentence in sentences:
+                starts.append(sentence.start())
+                ends.append(sentence.end())
+                sentence_term_ids = {
+                    self.term_ids[term]
+                    for term in index.dictionary.preprocess_document(sentence.group())
+                    if term in self.term_ids
+                }
+                sentence_n_terms.append(len(sentence_term_ids))
+                term_ids.extend(sorted(sentence_term_ids))
+
+        self._doc_indptr = np.zeros(len(doc_n_sentences) + 1, dtype=np.int64)
+        np.cumsum(doc_n_sentences, out=self._doc_indptr[1:])
+        self._sentence_starts = np.array(starts, dtype=np.int32)
+        self._sentence_ends = np.array(ends, dtype=np.int32)
+        self._sentence_indptr = np.zeros(len(sentence_n_terms) + 1, dtype=np.int64)
+        np.cumsum(sentence_n_terms, out=self._sentence_indptr[1:])
+        self._sentence_term_ids = np.array(term_ids, dtype=np.int32)
+        return
+
+    def get_snippet(
+        self, docID, body: str, query_terms: List[str], max_length: int = 150
+    ) -> str:
+        """Returns the window of consecutive sentences of a document of at most max_length characters whose distinct
+        query terms have the highest total idf, the first sentences if no query term is found
+
+        Arguments:
+            docID {[type]} -- Document id
+            body {str} -- Body of the document, the same as given at build time
+            query_terms {List[str]} -- Preprocessed query terms, e.g. from dictionary.preprocess_document
+
+        Keyword Arguments:
+            max_length {int} -- Maximum amount of characters of the snippet, longer sentences are cut (default: {150})
+
+        Returns:
+            str -- Snippet, with "..." where the document text is cut
+        """
+        row = self.doc_rows.get(docID)
+        if row is None or self._doc_indptr[row] == self._doc_indptr[row + 1]:
+            return _cut(body, 0, len(body), max_length)
+
+        # Bit of each query term found in the index
+        query_bits = {}
+        for term in query_terms:
+            if term in self.term_ids:
+                query_bits.setdefault(self.term_ids[term], 1 << len(query_bits))
+        bit_idfs = [self.idfs[term_id] for term_id in query_bits]
+
+        # Query terms of each sentence as a bit mask
+        first, last = self._doc_indptr[row], self._doc_indptr[row + 1]
+        masks = []
+        for sentence in range(first, last):
+            mask = 0
+            for term_id in self._sentence_term_ids[
+                self._sentence_indptr[sentence] : self._sentence_indptr[sentence + 1]
+            ]:
+                mask |= query_bits.get(term_id, 0)
+            masks.append(mask)
+
+        # Longest window starting at every sentence, the earliest best window wins ties
+        best_score, best_window = -1, (first, first)
+        end = first
+        for start in range(first, last):
+            end = max(end, start)
+            while (
+                end + 1 < last
+                and self._sentence_ends[end + 1] - self._sentence_starts[start] <= max_length
+            ):
+                end += 1
+
+            mask = 0
+            for sentence in range(start, end + 1):
+                mask |= masks[sentence - first]
+            score = sum(idf for (bit, idf) in enumerate(bit_idfs) if mask >> bit & 1)
+            if score > best_score:
+                best_score, best_window = score, (start, end)
+
+        start, end = best_window
+        return _cut(
+            body, self._sentence_starts[start], self._sentence_ends[end], max_length
+        )
+
+
+def _cut(body: str, start: int, end: int, max_length: int) -> str:
+    """Returns body[start:end] cut to max_length characters at a word boundary, with "..." where the body is cut
+
+    Arguments:
+        body {str} -- Document body
+        start {int} -- First character
+        end {int} -- Last character (exclusive)
+        max_length {int} -- Maximum amount of characters, excluding "..."
+
+    Returns:
+        str -- Snippet
+    """
+    body = "" if not isinstance(body, str) else body
+    snippet = body[start:end]
+    if len(snippet) > max_length:
+        snippet = snippet[:max_length].rsplit(" ", 1)[0]
+    end = start + len(snippet)
+
+    prefix = "... " if body[:start].strip() else ""
+    suffix = " ..." if body[end:].strip() else ""
+    return prefix + " ".join(snippet.split()) + suffix
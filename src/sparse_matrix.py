@@ -0,0 +1,181 @@
+# Module 4b - Sparse term-document matrix
+# Purpose: Compressed sparse row (CSR) form of the inverted index to score many documents or queries at once with numpy
+
+import numpy as np
+from inverted_index import InvertedIndex
+from typing import Dict, List, Tuple
+
+
+def gather_rows(indptr: np.ndarray, data: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Concatenates rows of a CSR structure without a python loop over the rows
+
+    Arguments:
+        indptr {np.ndarray} -- Row i is data[indptr[i]:indptr[i + 1]]
+        data {np.ndarray} -- Values of all rows
+        rows {np.ndarray} -- Rows to gather
+
+    Returns:
+        np.ndarray -- Values of the given rows, one after the other
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return data[offsets + np.arange(lengths.sum())]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> List[np.ndarray]:
+    """Returns for each row of scores the columns of the k highest positive scores, by decreasing score and ties by
+    increasing column like a stable sort
+
+    Arguments:
+        scores {np.ndarray} -- Matrix of scores (n_rows, n_columns)
+        k {int} -- Amount of columns to keep per row
+
+    Returns:
+        List[np.ndarray] -- Columns kept for each row
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(len(scores))]
+
+    # k-th highest score of each row, every column reaching it is a candidate so that ties are broken by column
+    kth_scores = -np.partition(-scores, k - 1, axis=1)[:, k - 1]
+    results = []
+    for (row, kth_score) in zip(scores, kth_scores):
+        columns = np.flatnonzero((row >= kth_score) & (row > 0))
+        order = np.argsort(-row[columns], kind="stable")[:k]
+        results.append(columns[order])
+    return results
+
+
+def csr_inner_products(
+    indptr: np.ndarray,
+    rows: np.ndarray,
+    weights: np.ndarray,
+    n_rows: int,
+    query_indptr: np.ndarray,
+    query_term_ids: np.ndarray,
+    query_weights: np.ndarray,
+) -> np.ndarray:
+    """Calculates inner products between queries and the rows of a term-major CSR matrix, only the entries of the
+    query terms are visited
+
+    Arguments:
+        indptr {np.ndarray} -- Entries of term id t are rows[indptr[t]:indptr[t + 1]] and weights[indptr[t]:indptr[t + 1]]
+        rows {np.ndarray} -- Row (e.g. document) of each entry
+        weights {np.ndarray} -- Weight of each entry
+        n_rows {int} -- Amount of rows
+        query_indptr {np.ndarray} -- Terms of query i are query_term_ids[query_indptr[i]:query_indptr[i + 1]]
+        query_term_ids {np.ndarray} -- Term ids of all queries
+        query_weights {np.ndarray} -- Weights of the query terms
+
+    Returns:
+        np.ndarray -- Matrix of inner products (n_queries, n_rows)
+    """
+    n_queries = len(query_indptr) - 1
+
+    # Every (query, entry) pair of the query terms
+    entry_lengths = indptr[query_term_ids + 1] - indptr[query_term_ids]
+    entry_rows = gather_rows(indptr, rows, query_term_ids)
+    entry_weights = gather_rows(indptr, weights, query_term_ids)
+    query_rows = np.repeat(
+        np.repeat(np.arange(n_queries), np.diff(query_indptr)), entry_lengths
+    )
+    entry_weights = np.repeat(query_weights, entry_lengths) * entry_weights
+
+    scores = np.bincount(
+        query_rows * n_rows + entry_rows, weights=entry_weights, minlength=n_queries * n_rows
+    )
+    return scores.reshape(n_queries, n_rows)
+
+
+class TermDocumentMatrix:
+    """TF-IDF weights of an inverted index as CSR arrays: documents of term id t are
+    doc_rows[indptr[t]:indptr[t + 1]] with weights tf_idfs[indptr[t]:indptr[t + 1]]
+
+    Attributes:
+        terms {List[str]} -- Index terms sorted alphabetically, the id of a term is its position
+        docIDs {List} -- DocIDs of the index, the row of a document is its position
+    """
+
+    def __init__(self, index: InvertedIndex):
+        self.terms = sorted(index.index.keys())
+        self.term_ids = {term: i for (i, term) in enumerate(self.terms)}
+        self.docIDs = list(index.docIDs)
+        self.doc_rows = {docID: i for (i, docID) in enumerate(self.docIDs)}
+
+        postings = [index.index[term] for term in self.terms]
+        self.document_freqs = np.array([len(docs) for docs in postings], dtype=np.int64)
+        self.indptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(self.document_freqs, out=self.indptr[1:])
+        self.posting_doc_rows = np.fromiter(
+            (self.doc_rows[docID] for docs in postings for docID in docs),
+            dtype=np.int64,
+            count=self.indptr[-1],
+        )
+        self.tf_idfs = np.fromiter(
+            (weight["tf-idf"] for docs in postings for weight in docs.values()),
+            dtype=np.float64,
+            count=self.indptr[-1],
+        )
+        return
+
+    def to_query_matrix(
+        self, query_vectors: List[Dict[str, float]]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Converts sparse query vectors to CSR arrays over the term ids, terms not in the index are dropped
+
+        Arguments:
+            query_vectors {List[Dict[str, float]]} -- Query vectors in form of {term: weight}
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray] -- indptr, term ids and weights of the queries
+        """
+        term_ids, weights = [], []
+        indptr = np.zeros(len(query_vectors) + 1, dtype=np.int64)
+        for (i, query_vector) in enumerate(query_vectors):
+            for (term, weight) in query_vector.items():
+                if term in self.term_ids:
+                    term_ids.append(self.term_ids[term])
+                    weights.append(weight)
+            indptr[i + 1] = len(term_ids)
+
+        return indptr, np.array(term_ids, dtype=np.int64), np.array(weights, dtype=np.float64)
+
+    def inner_products(
+        self, query_indptr: np.ndarray, query_term_ids: np.ndarray, query_weights: np.ndarray
+    ) -> np.ndarray:
+        """Calculates inner products between queries in CSR form and all documents, only postings of the query terms
+        are visited
+
+        Arguments:
+            query_indptr {np.ndarray} -- Terms of query i are query_term_ids[query_indptr[i]:query_indptr[i + 1]]
+            query_term_ids {np.ndarray} -- Term ids of all queries
+            query_weights {np.ndarray} -- Weights of the query terms
+
+        Returns:
+            np.ndarray -- Matrix of inner products (n_queries, n_documents)
+        """
+        return csr_inner_products(
+            self.indptr,
+            self.posting_doc_rows,
+            self.tf_idfs,
+            len(self.docIDs),
+            query_indptr,
+            query_term_ids,
+            query_weights,
+        )
+
+    def to_document_major(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the transposed matrix, i.e. the terms of each document
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray] -- indptr, term ids and TF-IDF weights, terms of document row i
+                are term_ids[indptr[i]:indptr[i + 1]]
+        """
+        n_docs = len(self.docIDs)
+        posting_term_ids = np.repeat(np.arange(len(self.terms)), self.document_freqs)
+        order = np.argsort(self.posting_doc_rows, kind="stable")
+        doc_indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.posting_doc_rows, minlength=n_docs), out=doc_indptr[1:])
+        return doc_indptr, posting_term_ids[order], self.tf_idfs[order]
@@ -7,6 +7,7 @@ import numpy as np
 import os.path
 import pandas as pd
 import re
+from typing import List, Tuple
 
 
 # TODO: maybe add weighted costs for insertion and deletion?
@@ -20,40 +21,212 @@ sub_costs_matrix = pd.read_csv(
 )
 sub_costs_matrix = 1 + (1 / (sub_costs_matrix + 1))
 
+# Dense 26 x 26 array of the same costs indexed by character codes (ord(letter) - ord('a')).
+# Cost of subbing letter1 for letter2 is given by sub_costs[code1, code2], subbing a letter for itself costs 0
+letters = [chr(code) for code in range(ord("a"), ord("z") + 1)]
+sub_costs = sub_costs_matrix.loc[letters, letters].to_numpy(dtype=np.float64)
+np.fill_diagonal(sub_costs, 0)
+_sub_costs_rows = sub_costs.tolist()
+
+
+def encode_word(word: str) -> np.ndarray:
+    """Converts a lower case word into its array of character codes
+    
+    Arguments:
+        word {str} -- Word containing only letters a-z
+    
+    Returns:
+        np.ndarray -- Character codes where a is 0 and z is 25
+    """
+    return np.frombuffer(word.encode("ascii"), dtype=np.uint8).astype(np.intp) - ord("a")
+
 
-def weighted_edit_distance(word: str, word_target: str) -> float:
+def encode_words(words: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Converts a list of lower case words into a padded matrix of character codes
+    
+    Arguments:
+        words {List[str]} -- Words containing only letters a-z
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- (codes, lengths) where codes has one row per word padded with 0s
+    """
+    lengths = np.array([len(word) for word in words], dtype=np.intp)
+    codes = np.zeros(shape=[len(words), lengths.max() if len(words) > 0 else 0], dtype=np.intp)
+    for (i, word) in enumerate(words):
+        codes[i, : lengths[i]] = encode_word(word)
+    return codes, lengths
+
+
+def character_histograms(codes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Counts letters of each encoded word
+    
+    Arguments:
+        codes {np.ndarray} -- Padded character codes of words (see encode_words)
+        lengths {np.ndarray} -- Length of each word
+    
+    Returns:
+        np.ndarray -- Matrix of letter counts with one row per word and one column per letter
+    """
+    n_words, m = codes.shape
+    valid = np.arange(m) < lengths[:, None]
+    flat_codes = (np.arange(n_words)[:, None] * len(letters) + codes)[valid]
+    histograms = np.bincount(flat_codes, minlength=n_words * len(letters))
+    return histograms.reshape(n_words, len(letters))
+
+
+def edit_distance_lower_bounds(word_histogram: np.ndarray, histograms: np.ndarray) -> np.ndarray:
+    """Cheap lower bounds of the edit distance between a word and many words from their letter counts.
+    Every letter missing from the word needs an insertion or substitution and every extra letter a deletion or
+    substitution, so the distance is at least the larger of the two totals. This also covers the length difference
+    
+    Arguments:
+        word_histogram {np.ndarray} -- Letter counts of the word
+        histograms {np.ndarray} -- Letter counts of the other words (see character_histograms)
+    
+    Returns:
+        np.ndarray -- Lower bound of the (weighted) edit distance to each word
+    """
+    differences = histograms - word_histogram
+    missing = np.clip(differences, 0, None).sum(axis=1)
+    extra = np.clip(-differences, 0, None).sum(axis=1)
+    return np.maximum(missing, extra)
+
+
+def weighted_edit_distance(
+    word: str, word_target: str, max_cost: float = np.inf
+) -> float:
     """
     Calculates weighted edit distance between start word and target word. 
     Insertion and deletion have cost 1. Substitution costs are based on given substitution error matrix
     Reference: CSI4107-TolerantRetrieval slides by Caroline Barrière
+
+    If max_cost is given the calculation is abandoned as soon as a whole row costs more than it, and only cells within
+    a diagonal band of width max_cost are computed since every edit costs at least 1. Costs above max_cost are returned as inf
     """
 
-    # Initialize n * m table
+    # Initialize n * m table, only the previous row is kept
     n, m = len(word), len(word_target)
-    opt = np.zeros(shape=[n + 1, m + 1])
+    word_codes = [ord(c) - ord("a") for c in word]
+    target_codes = [ord(c) - ord("a") for c in word_target]
+    band = n + m if max_cost == np.inf else int(np.floor(max_cost + 1e-9))
+
+    # Target can't be reached within the band
+    if abs(n - m) > band:
+        return np.inf
 
-    # Set opt(i,0) = i and opt(0,j) = j
-    opt[:, 0] = np.arange(0, n + 1)
-    opt[0, :] = np.arange(0, m + 1)
+    # Set opt(0,j) = j, cells outside of band are inf
+    previous_row = [j if j <= band else np.inf for j in range(0, m + 1)]
 
     # Fill out table
     for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            insert_cost = opt[i - 1, j] + 1
-            del_cost = opt[i, j - 1] + 1
-            sub_cost = opt[i - 1, j - 1] + (
-                sub_costs_matrix[word_target[j - 1]][word[i - 1]]
-                if word[i - 1] != word_target[j - 1]
-                else 0
-            )
+        # Set opt(i,0) = i
+        row = [i if i <= band else np.inf] + [np.inf] * m
+        costs = _sub_costs_rows[word_codes[i - 1]]
+        for j in range(max(1, i - band), min(m, i + band) + 1):
+            insert_cost = previous_row[j] + 1
+            del_cost = row[j - 1] + 1
+            sub_cost = previous_row[j - 1] + costs[target_codes[j - 1]]
 
             # Set cost at opt(i, j) as minimum of three costs
-            opt[i, j] = min(insert_cost, del_cost, sub_cost)
+            row[j] = min(insert_cost, del_cost, sub_cost)
+        previous_row = row
+
+        # Abandon if every path already costs more than max_cost
+        if min(row) > max_cost:
+            return np.inf
 
     # Cost is opt(N,M)
-    cost = opt[n, m]
+    cost = previous_row[m]
+
+    return cost if cost <= max_cost else np.inf
+
+
+def weighted_edit_distances(word: str, words_target: List[str]) -> np.ndarray:
+    """Calculates weighted edit distance between start word and many target words at once, see weighted_edit_distance
+    
+    Arguments:
+        word {str} -- Start word
+        words_target {List[str]} -- Target words
+    
+    Returns:
+        np.ndarray -- Weighted edit distance for each target word
+    """
+    codes, lengths = encode_words(words_target)
+    return batch_weighted_edit_distance(encode_word(word), codes, lengths)
+
+
+def batch_weighted_edit_distance(
+    word_codes: np.ndarray,
+    codes: np.ndarray,
+    lengths: np.ndarray,
+    max_cost: float = np.inf,
+) -> np.ndarray:
+    """Row-vectorized weighted edit distance from one word to a batch of encoded target words.
+    Each row i of the DP table is computed for all targets and all columns j at once. Within a row
+    opt(i, j) = min(a_j, opt(i, j-1) + 1) where a_j is the best of insertion and substitution, which unrolls
+    to opt(i, j) = j + min_{k <= j}(a_k - k) and is computed as a cumulative minimum.
+    With max_cost, only the diagonal band is computed and targets are dropped from the batch once their whole row costs more
+    (see weighted_edit_distance).
+    
+    Arguments:
+        word_codes {np.ndarray} -- Character codes of start word
+        codes {np.ndarray} -- Padded character codes of target words (see encode_words)
+        lengths {np.ndarray} -- Length of each target word
+
+    Keyword Arguments:
+        max_cost {float} -- Costs above this are returned as inf (default: {np.inf})
+    
+    Returns:
+        np.ndarray -- Weighted edit distance for each target word
+    """
+    n_targets, m = codes.shape
+    n = len(word_codes)
+    columns = np.arange(0, m + 1, dtype=np.float64)
+    banded = max_cost != np.inf
+    band = int(np.floor(max_cost + 1e-9)) if banded else n + m
+
+    # Targets still in the batch
+    alive = np.arange(n_targets)
+
+    # Set opt(0,j) = j, cells outside of band are inf
+    previous_rows = np.tile(columns, (n_targets, 1))
+    previous_rows[:, band + 1 :] = np.inf
+    rows = np.empty_like(previous_rows)
+
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - band), min(m, i + band)
+        if banded:
+            rows.fill(np.inf)
+
+        # Set opt(i,0) = i
+        rows[:, 0] = i if i <= band else np.inf
+
+        if lo <= hi:
+            insert_costs = previous_rows[:, lo : hi + 1] + 1
+            sub_cost = previous_rows[:, lo - 1 : hi] + sub_costs[word_codes[i - 1], codes[:, lo - 1 : hi]]
 
-    return cost
+            # Deletions are resolved with the cumulative minimum starting from the column left of the band
+            block = rows[:, lo - 1 : hi + 1]
+            block[:, 0] -= columns[lo - 1]
+            block[:, 1:] = np.minimum(insert_costs, sub_cost) - columns[lo : hi + 1]
+            np.minimum.accumulate(block, axis=1, out=block)
+            block += columns[lo - 1 : hi + 1]
+
+        previous_rows, rows = rows, previous_rows
+
+        # Drop targets where every path already costs more than max_cost
+        if banded:
+            keep = previous_rows.min(axis=1) <= max_cost
+            if not keep.all():
+                alive, codes, lengths = alive[keep], codes[keep], lengths[keep]
+                previous_rows = previous_rows[keep]
+                rows = np.empty_like(previous_rows)
+
+    # Cost is opt(N,M) for each target, padding after the end of a word doesn't affect earlier columns
+    results = np.full(n_targets, np.inf)
+    results[alive] = previous_rows[np.arange(len(alive)), lengths]
+    results[results > max_cost] = np.inf
+    return results
 
 
 class SpellingCorrector:
@@ -61,14 +234,29 @@ class SpellingCorrector:
     Spelling corrector for a given lexicon using weighted edit distance to determine most likely words
     """
 
-    def __init__(self, lexicon: list):
+    def __init__(
+        self,
+        lexicon: list,
+        bigram_language_model=None,
+        language_model_weight: float = 0.3,
+    ):
         # Set attributes
         self.lexicon = set([self._preprocess_string(word) for word in lexicon])
+        self.bigram_language_model = bigram_language_model
+        self.language_model_weight = language_model_weight
 
         # Remove empty string if it exists
         if "" in self.lexicon:
             self.lexicon.remove("")
 
+        # Encode lexicon once for batched edit distances, grouped by first letter. Words are sorted so ties keep alphabetical order
+        # Stored as {letter: (words, codes, lengths, histograms)}
+        self._encoded_lexicon = {}
+        lexicon_sorted = sorted(self.lexicon)
+        for letter, words in itertools.groupby(lexicon_sorted, key=lambda w: w[0]):
+            self._encoded_lexicon[letter] = self._encode_lexicon(list(words))
+        self._encoded_lexicon[None] = self._encode_lexicon(lexicon_sorted)
+
         return
 
     def check_query(
@@ -77,6 +265,8 @@ class SpellingCorrector:
         """
         Given query, use weighted edit distance to return list of alternate suggestions in order of most to least rank in form of (suggestedQuery, totalCost)
         If all words in the query are in the lexicon then return empty list instead
+        Suggestions are combined with a beam search so the cost grows linearly with the query length.
+        If the corrector has a bigram language model, transitions between words are also scored with it
         """
 
         # If empty return original query
@@ -98,10 +288,12 @@ class SpellingCorrector:
         # Get closest words in lexicon based on edit distance for all words in the query
         word_suggestions = [self.check_word(word) for word in words]
 
-        # Get all combinations of suggestions - https://stackoverflow.com/questions/12935194/combinations-between-two-lists
-        suggested_queries = list(itertools.product(*word_suggestions))
+        # Get best combinations of suggestions, one more than the limit in case the input query is one of them
+        operators = [word.lower() in {"and", "or", "and_not"} for word in query.split(" ")]
+        suggested_queries = self._beam_search(word_suggestions, operators, limit + 1)
         suggested_queries = [
-            self._join_words(query, word_costs) for word_costs in suggested_queries
+            (self._join_words(query, word_costs)[0], cost)
+            for word_costs, cost in suggested_queries
         ]
 
         # Remove queries which are same as input query - due to current handling of * TODO: fix
@@ -124,6 +316,50 @@ class SpellingCorrector:
 
         return suggested_queries
 
+    def _beam_search(
+        self, word_suggestions: List[list], operators: List[bool], beam_width: int
+    ) -> List[Tuple[list, float]]:
+        """
+        Helper function for self.check_query. Combines the suggestions (word, cost) of each query word from left to right keeping
+        only the best beam_width partial queries at each position. Without a language model the score is the total edit cost,
+        for which the beam gives the same best queries as trying every combination. Ties are kept in the order of the combinations.
+        With a language model a transition cost is added between consecutive words that are not boolean operators, see self._transition_cost.
+        Returns list of (word_costs, score) sorted by score
+        """
+        # Partial queries as (score, suggestion indices, word_costs)
+        beam = [(0, (), [])]
+
+        for (position, suggestions) in enumerate(word_suggestions):
+            candidates = []
+            for (score, indices, word_costs) in beam:
+                for (i, (word, cost)) in enumerate(suggestions):
+                    candidate_score = score + cost
+                    if (
+                        self.bigram_language_model is not None
+                        and position > 0
+                        and not operators[position]
+                        and not operators[position - 1]
+                    ):
+                        candidate_score += self._transition_cost(word_costs[-1][0], word)
+                    candidates.append((candidate_score, indices + (i,), word_costs + [(word, cost)]))
+
+            candidates.sort(key=lambda candidate: candidate[:2])
+            beam = candidates[:beam_width]
+
+        return [(word_costs, score) for (score, _, word_costs) in beam]
+
+    def _transition_cost(
+        self, w1: str, w2: str, backoff: float = 0.4, smoothing: float = 1e-6
+    ) -> float:
+        """
+        Helper function for self._beam_search. Cost -weight * log10(P(w2|w1)) of word w2 following w1 according to the bigram language model.
+        Unseen bigrams back off to backoff * P(w2), so with the default weight an unseen pair costs less than two edits
+        """
+        proba = self.bigram_language_model.get_posterior(w1, w2)
+        if proba == 0:
+            proba = backoff * self.bigram_language_model.get_prior(w2)
+        return -self.language_model_weight * np.log10(proba + smoothing)
+
     def _join_words(self, query: str, word_costs: list) -> tuple:
         """
         Helper function for self.check_query. Given a list of tuples (word, cost) concatenate all words and sum all costs to return (query, totalCost)
@@ -153,13 +389,21 @@ class SpellingCorrector:
         return (query, total_cost)
 
     def check_word(
-        self, word: str, same_first_letter: bool = True, limit: int = 10
+        self,
+        word: str,
+        same_first_letter: bool = True,
+        limit: int = 10,
+        use_candidates: bool = True,
     ) -> list:
         """
         Given a word, if the word is not in the lexicon then will calculate weighted edit distance between word and all other words
         in the lexicon and return a list of most likely to least likely word replacements in form of (word, weightedEditDistance). 
         Likelihood will be based on the weighted edit distance.
         If the word is in the lexicon then return (word, 0) 
+        Words are compared in order of a lower bound of their distance (length and letter counts) and skipped once the bound is
+        worse than the limit-th best word found, so only plausible candidates get a full edit distance calculation.
+        With use_candidates the limit-th best cost is first taken from a small candidate set, see self._check_word_candidates.
+        Both give the same results
         """
 
         if word in self.lexicon:
@@ -169,20 +413,89 @@ class SpellingCorrector:
         word = self._preprocess_string(word)
 
         # Compare with only words with same starting letter
-        if same_first_letter:
-            lexicon = [w for w in self.lexicon if w[0] == word[0]]
-        else:
-            lexicon = list(self.lexicon)
+        key = word[0] if same_first_letter else None
+        if key not in self._encoded_lexicon:
+            return []
 
-        # Calculate weighted edit distance between word and all other words
-        edit_distances = [(w, weighted_edit_distance(word, w)) for w in lexicon]
+        lexicon, codes, lengths, histograms = self._encoded_lexicon[key]
+        word_codes = encode_word(word)
+        lower_bounds = edit_distance_lower_bounds(
+            character_histograms(word_codes[None, :], np.array([len(word)]))[0], histograms
+        )
+
+        if use_candidates:
+            return self._check_word_candidates(word_codes, lower_bounds, key, limit)
+
+        # Filter words by lower bound of their distance and process them from most to least plausible, one bound at a time
+        order = np.argsort(lower_bounds, kind="stable")
+        bounds, starts = np.unique(lower_bounds[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+
+        best_indices = np.array([], dtype=np.intp)
+        best_costs = np.array([])
+        threshold = np.inf
+        for (bound, start, end) in zip(bounds, starts, ends):
+            # Remaining words can't be better than the current limit-th best
+            if bound > threshold:
+                break
+
+            # Calculate weighted edit distance in one batch, abandoning words that get worse than the limit-th best
+            indices = order[start:end]
+            costs = batch_weighted_edit_distance(
+                word_codes, codes[indices], lengths[indices], max_cost=threshold
+            )
 
-        # Sort by most likely to least likely
-        edit_distances.sort(key=lambda pair: pair[1])
+            # Keep best words so far, ties are kept alphabetical by their position in the lexicon
+            best_indices = np.append(best_indices, indices[costs != np.inf])
+            best_costs = np.append(best_costs, costs[costs != np.inf])
+            best = np.lexsort((best_indices, best_costs))[:limit]
+            best_indices, best_costs = best_indices[best], best_costs[best]
+            if len(best_costs) == limit:
+                threshold = best_costs[-1]
 
-        # Limit results
-        if len(edit_distances) > limit:
-            edit_distances = edit_distances[:limit]
+        edit_distances = [(lexicon[i], cost) for (i, cost) in zip(best_indices, best_costs)]
+
+        return edit_distances
+
+    def _encode_lexicon(self, words: List[str]) -> tuple:
+        """
+        Helper function for self.__init__. Encodes sorted lexicon words as (words, codes, lengths, histograms)
+        """
+        codes, lengths = encode_words(words)
+        return (words, codes, lengths, character_histograms(codes, lengths))
+
+    def _check_word_candidates(
+        self, word_codes: np.ndarray, lower_bounds: np.ndarray, key: str, limit: int
+    ) -> list:
+        """
+        Helper function for self.check_word. Candidates are the 3 * limit words with the lowest distance bounds from the letter
+        counts of the lexicon. Their weighted edit distances give the limit-th best cost as a threshold in one batch, then every
+        other word whose bound reaches the threshold is compared in a second batch abandoning words that get worse. Words left
+        out can't be better than the threshold, so the results are the same as comparing with the whole lexicon, with two
+        batches instead of one per bound value
+        """
+        lexicon, codes, lengths, _ = self._encoded_lexicon[key]
+
+        # Candidates in lexicon order
+        n_candidates = min(3 * limit, len(lexicon))
+        candidates = np.sort(np.argpartition(lower_bounds, n_candidates - 1)[:n_candidates])
+        costs = batch_weighted_edit_distance(word_codes, codes[candidates], lengths[candidates])
+        threshold = np.partition(costs, limit - 1)[limit - 1] if len(costs) >= limit else np.inf
+
+        # Other words which could still be in the limit best
+        others = lower_bounds <= threshold
+        others[candidates] = False
+        others = np.flatnonzero(others)
+        other_costs = batch_weighted_edit_distance(
+            word_codes, codes[others], lengths[others], max_cost=threshold
+        )
+
+        # Ties are kept alphabetical by their position in the lexicon
+        indices = np.concatenate([candidates, others])
+        costs = np.concatenate([costs, other_costs])
+        best = np.lexsort((indices, costs))[:limit]
+        best = best[costs[best] != np.inf]
+        edit_distances = [(lexicon[indices[i]], costs[i]) for i in best]
 
         return edit_distances
 
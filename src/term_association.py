@@ -0,0 +1,129 @@
+# Module 7b - Query Expansion with corpus term associations
+# Purpose: Find for each term the terms that co-occur the most with it within the documents of the collection
+
+import numpy as np
+from inverted_index import InvertedIndex
+from sparse_matrix import TermDocumentMatrix, gather_rows
+from typing import List, Tuple
+
+
+class TermAssociationIndex:
+    """Top k associated terms of each term of an index, by normalized pointwise mutual information (NPMI) of terms
+    appearing in the same documents: log(P(a, b) / (P(a) P(b))) / -log(P(a, b)), between -1 and 1.
+
+    Associates are stored as CSR arrays: associates of term id i are _associate_ids[_indptr[i]:_indptr[i + 1]] sorted by
+    decreasing score. Terms are the preprocessed (stemmed) index terms, each shown by its shortest raw word.
+
+    Attributes:
+        terms {List[str]} -- Index terms sorted alphabetically, the id of a term is its position
+        surface_forms {List[str]} -- Raw word shown for each term id
+    """
+
+    def __init__(
+        self,
+        index: InvertedIndex,
+        k: int = 10,
+        min_cooccurrence: int = 3,
+        max_document_freq: float = 0.5,
+    ):
+        """
+        Arguments:
+            index {InvertedIndex} -- Index of the collection
+
+        Keyword Arguments:
+            k {int} -- Amount of associates stored per term (default: {10})
+            min_cooccurrence {int} -- Minimum amount of documents two terms must share to be associated (default: {3})
+            max_document_freq {float} -- Terms found in a larger fraction of the documents are neither expanded nor
+                associated as they don't discriminate (default: {0.5})
+        """
+        matrix = TermDocumentMatrix(index)
+        self.terms = matrix.terms
+        n_terms = len(self.terms)
+        n_docs = len(index.docIDs)
+
+        # Word typed by the user -> term id, term id -> shortest raw word
+        self._word_ids = {}
+        self.surface_forms = list(self.terms)
+        term_ids = matrix.term_ids
+        has_surface_form = np.zeros(n_terms, dtype=bool)
+        for word in sorted(index.dictionary.words_raw, key=lambda word: (len(word), word)):
+            processed = index.dictionary._preprocess_tokens([word])
+            if len(processed) == 1 and processed[0] in term_ids:
+                term_id = term_ids[processed[0]]
+                self._word_ids[word] = term_id
+                if not has_surface_form[term_id]:
+                    self.surface_forms[term_id] = word
+                    has_surface_form[term_id] = True
+
+        # Term -> document rows and document row -> terms
+        document_freqs = matrix.document_freqs
+        term_indptr = matrix.indptr
+        term_doc_rows = matrix.posting_doc_rows
+        posting_term_ids = np.repeat(np.arange(n_terms), document_freqs)
+
+        # Frequent terms are dropped from the documents
+        is_kept = document_freqs <= max_document_freq * n_docs
+        kept_postings = is_kept[posting_term_ids]
+        order = np.argsort(term_doc_rows[kept_postings], kind="stable")
+        doc_term_ids = posting_term_ids[kept_postings][order]
+        doc_indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(term_doc_rows[kept_postings], minlength=n_docs),
+            out=doc_indptr[1:],
+        )
+
+        # Count documents shared with every other term, one term at a time
+        self._indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        associate_ids, scores = [], []
+        for term_id in range(n_terms):
+            n_associates = 0
+            if is_kept[term_id] and document_freqs[term_id] >= min_cooccurrence:
+                rows = term_doc_rows[term_indptr[term_id] : term_indptr[term_id + 1]]
+                cooccurrences = np.bincount(
+                    gather_rows(doc_indptr, doc_term_ids, rows), minlength=n_terms
+                )
+                cooccurrences[term_id] = 0
+                candidates = np.flatnonzero(cooccurrences >= min_cooccurrence)
+
+                # NPMI, 1 for terms always appearing together
+                joint = cooccurrences[candidates] / n_docs
+                pmi = np.log(
+                    joint * n_docs * n_docs / (document_freqs[term_id] * document_freqs[candidates])
+                )
+                npmi = np.where(joint < 1, pmi / -np.log(np.minimum(joint, 1 - 1e-12)), 1.0)
+
+                # Keep top k, ties sorted alphabetically
+                top = np.lexsort((candidates, -npmi))[:k]
+                associate_ids.append(candidates[top])
+                scores.append(npmi[top])
+                n_associates = len(top)
+            self._indptr[term_id + 1] = self._indptr[term_id] + n_associates
+
+        self._associate_ids = np.concatenate(associate_ids + [np.empty(0, dtype=np.int64)]).astype(np.int32)
+        self._scores = np.concatenate(scores + [np.empty(0)]).astype(np.float32)
+        return
+
+    def get_associates(self, word: str, k: int = None) -> List[Tuple[str, float]]:
+        """Returns the terms associated the most with a raw word
+
+        Arguments:
+            word {str} -- Raw word, e.g. a query term
+
+        Keyword Arguments:
+            k {int} -- Amount of associates to return, at most the k of the index (default: {None})
+
+        Returns:
+            List[Tuple[str, float]] -- List of (raw word, NPMI) sorted by decreasing NPMI, empty if word isn't in the
+                vocabulary
+        """
+        term_id = self._word_ids.get(word)
+        if term_id is None:
+            return []
+
+        start, end = self._indptr[term_id], self._indptr[term_id + 1]
+        return [
+            (self.surface_forms[associate_id], float(score))
+            for (associate_id, score) in zip(
+                self._associate_ids[start:end][:k], self._scores[start:end][:k]
+            )
+        ]
@@ -0,0 +1,89 @@
+# Module 5c - Topic Index
+# Purpose: Filter documents by topic and count the topics of search results without reading the documents
+
+import numpy as np
+from typing import List, Tuple
+
+# Amount of set bits of every byte
+_BYTE_POPCOUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class TopicIndex:
+    """Topic -> documents bitmaps of a collection built at ingestion: bit i of the bitmap of a topic is set if document
+    row i has the topic. Bitmaps are packed 8 documents per byte in a single (n_topics, n_bytes) matrix, so that the
+    topics of a whole set of documents are counted in one pass over the matrix.
+
+    Attributes:
+        docIDs {List} -- DocIDs of the collection, the row of a document is its position, e.g. the docIDs of the index
+        topics {List[str]} -- Topics sorted alphabetically, the id of a topic is its position
+    """
+
+    def __init__(self, docIDs: list, doc_topics: List[List[str]]):
+        """
+        Arguments:
+            docIDs {list} -- DocIDs of the collection
+            doc_topics {List[List[str]]} -- Topics of each document
+        """
+        self.docIDs = list(docIDs)
+        self.doc_rows = {docID: i for (i, docID) in enumerate(self.docIDs)}
+        self.topics = sorted({topic for topics in doc_topics for topic in topics})
+        self.topic_ids = {topic: i for (i, topic) in enumerate(self.topics)}
+
+        # Every (topic, document) pair
+        topic_ids = [self.topic_ids[topic] for topics in doc_topics for topic in topics]
+        doc_rows = np.repeat(np.arange(len(self.docIDs)), [len(topics) for topics in doc_topics])
+
+        bitmaps = np.zeros((len(self.topics), len(self.docIDs)), dtype=bool)
+        bitmaps[topic_ids, doc_rows] = True
+        self._bitmaps = np.packbits(bitmaps, axis=1)
+        return
+
+    def get_mask(self, topic: str) -> np.ndarray:
+        """Returns which documents have a topic
+
+        Arguments:
+            topic {str} -- Topic
+
+        Returns:
+            np.ndarray -- Boolean mask aligned with docIDs, all False for unknown topics
+        """
+        if topic not in self.topic_ids:
+            return np.zeros(len(self.docIDs), dtype=bool)
+
+        bitmap = self._bitmaps[self.topic_ids[topic]]
+        return np.unpackbits(bitmap, count=len(self.docIDs)).astype(bool)
+
+    def get_docIDs(self, topic: str) -> list:
+        """Returns the docIDs of the documents with a topic, to be used as a candidate filter during retrieval
+
+        Arguments:
+            topic {str} -- Topic
+
+        Returns:
+            list -- DocIDs in order of the rows
+        """
+        return [self.docIDs[row] for row in np.flatnonzero(self.get_mask(topic))]
+
+    def facet_counts(self, docIDs, limit: int = None) -> List[Tuple[str, int]]:
+        """Counts the topics of a set of documents, e.g. all the results of a query
+
+        Arguments:
+            docIDs {[type]} -- DocIDs of the documents, docIDs not in the index are ignored
+
+        Keyword Arguments:
+            limit {int} -- Amount of topics to return, all if None (default: {None})
+
+        Returns:
+            List[Tuple[str, int]] -- List of (topic, amount of documents) sorted by decreasing amount then topic, only
+                topics of at least one document
+        """
+        rows = [self.doc_rows[docID] for docID in docIDs if docID in self.doc_rows]
+        mask = np.zeros(len(self.docIDs), dtype=bool)
+        mask[rows] = True
+
+        # Documents having each topic among the given documents, counted by bytes
+        counts = _BYTE_POPCOUNTS[self._bitmaps & np.packbits(mask)].sum(axis=1)
+
+        topic_ids = np.flatnonzero(counts)
+        topic_ids = topic_ids[np.argsort(-counts[topic_ids], kind="stable")][:limit]
+        return [(self.topics[i], int(counts[i])) for i in topic_ids]
@@ -15,6 +15,27 @@ from sentence_preprocessing import tokenize
 from typing import List, Tuple
 
 
+def preprocess_query_vector(
+    dictionary: Dictionary, query_vector: List[Tuple[str, float]]
+) -> List[Tuple[str, float]]:
+    """Preprocesses the words of a query vector one by one, so that every weight stays with its word. Words removed by
+    the preprocessing, e.g. stopwords, are dropped. Shared by VectorSpaceModel and the index shards of sharded_search
+
+    Arguments:
+        dictionary {Dictionary} -- Dictionary of the index
+        query_vector {List[Tuple[str, float]]} -- Sparse query vector of raw words
+
+    Returns:
+        List[Tuple[str, float]] -- Sparse query vector of preprocessed words
+    """
+    preprocessed = []
+    for (word, weight) in query_vector:
+        words = dictionary._preprocess_tokens([word])
+        if len(words) == 1:
+            preprocessed.append((words[0], weight))
+    return preprocessed
+
+
 class VectorSpaceModel:
     """
     Vector space model for retrieval for given index
@@ -53,11 +74,15 @@ class VectorSpaceModel:
         relevant_doc_ids: set = {},
         non_relevant_doc_ids: set = {},
         reverse: bool = True,
+        candidate_doc_ids=None,
+        feedback_key=None,
     ) -> list:
         """
         Given query string searches through documents to find best matches and returns docIDs with best match, but will exclude documents with similarity of 0.
         Query weights for each term are set to 1
         Uses either "inner-product" or "cosine" for similarity 
+        If candidate_doc_ids is given only those documents are scored, see vector_search
+        feedback_key identifies the relevance feedback sets (e.g. the query) so that Rocchio reuses its previous update
         Returns a list of tuples (docID, similarity)
         """
         query_vector = self.to_vector(query)
@@ -70,6 +95,8 @@ class VectorSpaceModel:
             relevant_doc_ids=relevant_doc_ids,
             non_relevant_doc_ids=non_relevant_doc_ids,
             reverse=reverse,
+            candidate_doc_ids=candidate_doc_ids,
+            feedback_key=feedback_key,
         )
         return search_results
 
@@ -82,34 +109,46 @@ class VectorSpaceModel:
         relevant_doc_ids: set = {},
         non_relevant_doc_ids: set = {},
         reverse: bool = True,
+        candidate_doc_ids=None,
+        feedback_key=None,
     ) -> list:
         """
         Given query vector weight in form of list of tuples (word, weight), searches through documents to find
         best matches and returns docIDs with best match, but will exclude documents with similarity of 0.
         Uses either "inner-product" or "cosine" for similarity 
+        candidate_doc_ids restricts scoring to the given documents, either a collection of docIDs (e.g. results of the
+        boolean model or a topic) or a boolean mask aligned with the index docIDs. Documents outside it are never scored
+        feedback_key identifies the relevance feedback sets (e.g. the query) so that Rocchio only updates the sums of
+        judged documents that changed since the previous search with the same key
         Returns a list of tuples (docID, similarity)
         """
         # Preprocess using dictionary preprocessing
-        query_tokens = [word for (word, _) in query_vector]
-        query_tokens = self.dictionary._preprocess_tokens(query_tokens)
-        for (i, word) in enumerate(query_tokens):
-            query_vector[i] = (word, query_vector[i][1])
+        query_vector = preprocess_query_vector(self.dictionary, query_vector)
 
         # Update using rocchio algorithm
         if len(relevant_doc_ids) > 0 or len(non_relevant_doc_ids) > 0:
             query_vector = self.rocchio.update_query_vector(
-                query_vector, relevant_doc_ids, non_relevant_doc_ids
+                query_vector,
+                relevant_doc_ids,
+                non_relevant_doc_ids,
+                feedback_key=feedback_key,
             )
 
         if similarity not in ["inner-product", "cosine"]:
             print("Similarity not defined")
             return None
-            
-        # Calculate similarity for all documents
+
+        # Nothing to score when every query word is removed by preprocessing
+        if len(query_vector) == 0:
+            return []
+
+        candidates = self._to_candidate_set(candidate_doc_ids)
+
+        # Calculate similarity for all (candidate) documents
         if similarity == "inner-product":
-            query_results = self._inner_product(query_vector)
+            query_results = self._inner_product(query_vector, candidates)
         elif similarity == "cosine":
-            query_results = self._cosine_sim(query_vector)
+            query_results = self._cosine_sim(query_vector, candidates)
 
         # Sort docIDs in order of decreasing similarity values
         query_results = list(query_results.items())
@@ -130,36 +169,66 @@ class VectorSpaceModel:
 
         return query_results
 
-    def _inner_product(self, query_vector: List[Tuple[str, float]]) -> dict:
+    def _to_candidate_set(self, candidate_doc_ids) -> set:
+        """Converts a candidate filter into a set of docIDs
+        
+        Arguments:
+            candidate_doc_ids -- None, collection of docIDs or boolean mask aligned with self.docIDs
+        
+        Returns:
+            set -- Set of candidate docIDs, None if there is no filter
+        """
+        if candidate_doc_ids is None:
+            return None
+
+        if isinstance(candidate_doc_ids, np.ndarray) and candidate_doc_ids.dtype == bool:
+            return set(np.asarray(self.docIDs, dtype=object)[candidate_doc_ids])
+
+        return set(candidate_doc_ids)
+
+    def _inner_product(
+        self, query_vector: List[Tuple[str, float]], candidates: set = None
+    ) -> dict:
         """
-        Calculates inner product between query vector and all documents.
-        Returns a dictionary {docID: inner_product}
+        Calculates inner product between query vector and all documents, or only the candidate documents if given.
+        Returns a dictionary {docID: inner_product} in order of the index docIDs, candidates not in the index are ignored
         """
-        # Initialize similarity for each docID
+        # Initialize similarity for each docID, in index order so that ties are ranked the same with or without candidates
         similarities = dict()
 
         for docID in self.docIDs:
-            similarities[docID] = 0
+            if candidates is None or docID in candidates:
+                similarities[docID] = 0
 
         # Calculate inner product for each docID
         for (word, word_weight) in query_vector:
-            docIDs = self.index.get_postings(word)
-            if docIDs == None:
+            postings = self.index.get_term_postings(word)
+            if postings == None:
                 continue
 
+            # Only visit documents which are both in the postings and candidates, iterating over the smaller one
+            if candidates is None:
+                docIDs = postings.keys()
+            elif len(candidates) < len(postings):
+                docIDs = [docID for docID in candidates if docID in postings]
+            else:
+                docIDs = [docID for docID in postings.keys() if docID in candidates]
+
             # Add weight to similarity for every document
             for docID in docIDs:
-                doc_weight = self.index.get_tf_idf(word, docID)
+                doc_weight = postings[docID]["tf-idf"]
                 similarities[docID] += word_weight * doc_weight
 
         return similarities
 
-    def _cosine_sim(self, query_vector: List[Tuple[str, float]]) -> float:
+    def _cosine_sim(
+        self, query_vector: List[Tuple[str, float]], candidates: set = None
+    ) -> float:
         """
         Calculates cosine similarity between query and document
         """
 
-        cosine_sim = self._inner_product(query_vector)
+        cosine_sim = self._inner_product(query_vector, candidates)
 
         # Normalize each inner product by product of lengths of query and doc vectors
         for docID, inner_prod in cosine_sim.items():